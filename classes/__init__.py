@@ -1,3 +1,12 @@
 from .gvm_hooks import *
 from .gvm_report import *
+from .gvm_async_report import *
 from .gvm_archive import *
+from .gvm_index import *
+from .gvm_pool import *
+from .gvm_workers import *
+from .gvm_jobs import *
+from .gvm_workspace import *
+from .gvm_benchmark import *
+from .gvm_fake_gvmd import *
+from .gvm_load_test import *
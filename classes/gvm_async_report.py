@@ -0,0 +1,403 @@
+import asyncio
+import contextvars
+import functools
+import io
+from base64 import b64decode
+from collections import deque
+from concurrent.futures import Executor
+from contextlib import nullcontext
+from typing import AsyncIterator, Callable, Iterable
+from lxml import etree
+from gvm.protocols.gmp.requests.v224 import Reports, Tasks
+from libraries import GVMJobCancelled, GVMLogger, GVMSyslogWriter
+from libraries.metrics import SUBPROCESS_FAILURES
+from libraries.gmp_results import GVMResultParser, iter_report_rows
+from config import Config
+from classes.gvm_index import GVMShipIndex
+from classes.gvm_report import GVMReport
+from classes.gvm_pool import GVMAsyncConnectionPool
+
+
+class GVMAsyncReport(GVMReport):
+    # Pages of a report are downloaded by one task while the previous ones are processed
+    # and written in the executor, the event loop itself only waits on sockets and pipes
+    LOCK_POLL_INTERVAL = 0.1
+
+    def __init__(
+        self,
+        *args,
+        pool: GVMAsyncConnectionPool | None = None,
+        executor: Executor | None = None,
+        read_ahead: int | None = None,
+        **kwargs,
+    ):
+        super().__init__(*args, pool=pool, **kwargs)
+        self.executor = executor
+        self.read_ahead = max(
+            1, read_ahead if read_ahead is not None else Config.HOOKS_ASYNC_READ_AHEAD
+        )
+        self.__write_log = self.logger.write_log
+        self.__span = self.logger.span
+
+    async def __in_executor(self, function: Callable, *args):
+        # run_in_executor does not carry context variables over, the logs need them
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, function, *args)
+        )
+
+    async def ship_data_async(
+        self,
+        output_file: str,
+        force: bool = False,
+        report_id: str | None = None,
+        task: str | None = None,
+    ):
+        try:
+            with self.__span("ship"):
+                await self.__ship_data(output_file, force, report_id, task)
+            self.__write_log(
+                f"Shipping data completed (stages {self.stats.to_dict()['stages']})",
+                GVMLogger.INFO,
+            )
+
+        except GVMJobCancelled:
+            self.__write_log("Shipping data cancelled", GVMLogger.WARN)
+            raise
+        except Exception as e:
+            self.__write_log(f"Shipping data failed: {e}", GVMLogger.ERROR)
+            raise
+
+    async def __ship_data(
+        self,
+        output_file: str,
+        force: bool,
+        report_id: str | None,
+        task: str | None,
+    ):
+        if report_id:
+            self.__write_log(f"Shipping data of report {report_id}", GVMLogger.INFO)
+        elif task:
+            self.__write_log(f"Shipping data of task {task}", GVMLogger.INFO)
+        else:
+            self.__write_log("Shipping data", GVMLogger.INFO)
+        self.stats.report_id = report_id
+        pages, records = await self.__ingest(report_id, task, f"{output_file}-ingest")
+
+        if force and self.ship_index is not None:
+            self.__write_log("Forcing a full reship", GVMLogger.INFO)
+        await self.__tee_pages(pages, records, output_file, force)
+        if self.ship_index is not None:
+            self.stats.rows_skipped += self.ship_index.skipped
+            await self.__in_executor(self.ship_index.maintain)
+
+    async def __ingest(
+        self, report_id: str | None, task: str | None, temp_file: str
+    ) -> tuple[AsyncIterator, Callable[..., Iterable[dict]]]:
+        # The pages to download and how each of them turns into records
+        chunk_size = Config.REPORT_CHUNK_SIZE
+
+        if self.pool is not None:
+            if not report_id:
+                with self.stats.stage("ingest"), self.__span("resolve report"):
+                    report_id = await (
+                        self.get_task_report_id_async(task)
+                        if task
+                        else self.get_latest_report_id_async()
+                    )
+            self.stats.report_id = report_id
+            if self.ingest == "xml":
+                return self.fetch_pages_async(report_id), lambda page: (
+                    self.process_rows(iter_report_rows(page.find("report")), chunk_size)
+                )
+            return self.fetch_pages_async(
+                report_id, report_format_id=self.CSV_REPORT_FORMAT_ID
+            ), lambda page: self.__process_csv_page(page, chunk_size)
+
+        if self.ingest == "xml":
+            return self.__export_results(report_id, task, chunk_size), lambda rows: (
+                self.process_rows(rows, chunk_size)
+            )
+        return self.__export_csv(temp_file, report_id, task), lambda csv_file: (
+            self.process_data(csv_file, chunk_size)
+        )
+
+    def __process_csv_page(
+        self, response: etree._Element, chunk_size: int
+    ) -> Iterable[dict]:
+        content = response.find("report").find("report_format").tail
+        if not content:
+            return []
+        return self.process_data(io.BytesIO(b64decode(content)), chunk_size)
+
+    async def __export_csv(
+        self, output_file: str, report_id: str | None, task: str | None
+    ) -> AsyncIterator[str]:
+        script, command = self.export_csv_command(output_file, report_id, task)
+        with self.__span(f"ingest {script}"):
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=GVMLogger.correlation_env(),
+            )
+            _, stderr = await process.communicate()
+        stderr = stderr.decode(errors="replace")
+        self.log_script_output(script, stderr)
+        if process.returncode != 0:
+            SUBPROCESS_FAILURES.inc(script=script)
+            raise RuntimeError(
+                f"{script} failed with exit code {process.returncode}: "
+                f"{stderr.strip()}"
+            )
+        yield f"{output_file}.csv"
+
+    async def __export_results(
+        self, report_id: str | None, task: str | None, chunk_size: int
+    ) -> AsyncIterator[list[dict]]:
+        script = "export-xml-results.gmp.py"
+        process = await asyncio.create_subprocess_exec(
+            *self.export_xml_command(report_id, task),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=GVMLogger.correlation_env(),
+        )
+        stderr = asyncio.create_task(process.stderr.read())
+        parser = GVMResultParser()
+        rows = []
+        try:
+            with self.__span(f"ingest {script}"):
+                while data := await process.stdout.read(GVMResultParser.READ_SIZE):
+                    rows += await self.__in_executor(parser.feed, data)
+                    if chunk_size and len(rows) >= chunk_size:
+                        yield rows
+                        rows = []
+                rows += await self.__in_executor(parser.close)
+                if rows:
+                    yield rows
+
+                returncode = await process.wait()
+            output = (await stderr).decode(errors="replace")
+            self.log_script_output(script, output)
+            if returncode != 0:
+                SUBPROCESS_FAILURES.inc(script=script)
+                raise RuntimeError(
+                    f"{script} failed with exit code {returncode}: {output.strip()}"
+                )
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            stderr.cancel()
+
+    async def get_latest_report_id_async(self) -> str:
+        async with self.pool.session("get_reports") as gmp:
+            response = await gmp.send(
+                Reports.get_reports(
+                    details=False,
+                    filter_string="status=Done sort-reverse=modified first=1 rows=1",
+                )
+            )
+
+        reports = response.xpath("report")
+        if not reports:
+            raise RuntimeError("No finished report found")
+        return reports[0].get("id")
+
+    async def get_task_report_id_async(self, task: str) -> str:
+        async with self.pool.session("get_tasks") as gmp:
+            response = await gmp.send(
+                Tasks.get_tasks(details=False, filter_string=self.task_filter(task))
+            )
+
+        tasks = response.xpath("task")
+        if not tasks:
+            raise RuntimeError(f"Task {task} not found")
+        report = tasks[0].find("last_report/report")
+        if report is None:
+            raise RuntimeError(f"Task {task} has no finished report")
+        return report.get("id")
+
+    async def count_results_async(self, report_id: str) -> int | None:
+        async with self.pool.session("get_report") as gmp:
+            response = await gmp.send(
+                Reports.get_report(report_id=report_id, details=False)
+            )
+        count = response.findtext("report/report/result_count/filtered")
+        return int(count) if count else None
+
+    async def __fetch_page(
+        self, report_id: str, filter_string: str | None, **kwargs
+    ) -> etree._Element:
+        async with self.pool.session("get_report") as gmp:
+            return await gmp.send(
+                Reports.get_report(
+                    report_id=report_id,
+                    filter_string=filter_string,
+                    ignore_pagination=filter_string is None,
+                    details=True,
+                    **kwargs,
+                )
+            )
+
+    async def fetch_pages_async(
+        self, report_id: str, **kwargs
+    ) -> AsyncIterator[etree._Element]:
+        page_size = Config.GMP_PAGE_SIZE
+        total = await self.count_results_async(report_id) if page_size > 0 else None
+        if total is None:
+            yield await self.__fetch_page(report_id, None, **kwargs)
+            return
+
+        filters = [
+            f"first={first} rows={page_size}"
+            for first in range(1, max(total, 1) + 1, page_size)
+        ]
+        parallelism = max(1, Config.GMP_PAGE_PARALLELISM)
+        self.__write_log(
+            f"Fetching {total} results of report {report_id} in {len(filters)} pages "
+            f"of {page_size} ({parallelism} in parallel)",
+            GVMLogger.INFO,
+        )
+
+        # Pages are fetched ahead over separate connections but handed on in order
+        pending = deque()
+        try:
+            for filter_string in filters:
+                pending.append(
+                    asyncio.create_task(
+                        self.__fetch_page(report_id, filter_string, **kwargs)
+                    )
+                )
+                if len(pending) >= parallelism:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for fetch in pending:
+                fetch.cancel()
+
+    async def __tee_pages(
+        self,
+        pages: AsyncIterator,
+        records: Callable[..., Iterable[dict]],
+        output_file: str,
+        force: bool,
+    ):
+        self.__write_log(f"Outputting data to {output_file}", GVMLogger.INFO)
+        transaction = nullcontext()
+        if self.ship_index is not None:
+            await self.__acquire_index(self.ship_index)
+            transaction = self.ship_index.transaction(self.stats.report_id)
+        queue = asyncio.Queue(self.read_ahead)
+        downloader = asyncio.create_task(self.__download(pages, queue))
+        writer = GVMSyslogWriter(self.host_name, self.program_name)
+        try:
+            with self.stats.stage("output"), self.__span("output"):
+                await self.__in_executor(self.__open, writer, transaction, output_file)
+                try:
+                    await self.__output_pages(queue, records, writer, force)
+                except BaseException as e:
+                    await self.__in_executor(self.__close, writer, transaction, e)
+                    raise
+                await self.__in_executor(
+                    self.__close,
+                    writer,
+                    transaction,
+                    None,
+                    functools.partial(self.publish_output, output_file),
+                )
+        finally:
+            downloader.cancel()
+            await asyncio.gather(downloader, return_exceptions=True)
+            if self.ship_index is not None:
+                self.ship_index.release()
+        self.stats.rows_out += writer.lines_written
+        self.stats.bytes_written += writer.bytes_written
+        self.__write_log(
+            f"Outputting data completed ({writer.lines_written} lines, {writer.bytes_written} bytes per output)",
+            GVMLogger.INFO,
+        )
+
+    async def __acquire_index(self, ship_index: GVMShipIndex):
+        # Polled, a job waiting for another one of the same report holds no executor thread
+        report_id = self.stats.report_id
+        if ship_index.acquire(report_id, blocking=False):
+            return
+        self.__write_log(
+            f"Waiting for another job shipping report {report_id or '(any)'}",
+            GVMLogger.INFO,
+        )
+        while not ship_index.acquire(report_id, blocking=False):
+            await asyncio.sleep(self.LOCK_POLL_INTERVAL)
+
+    @staticmethod
+    async def __download(pages: AsyncIterator, queue: asyncio.Queue):
+        # Errors travel through the queue so they surface in the order of the pages
+        try:
+            async for page in pages:
+                await queue.put(page)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)
+
+    async def __output_pages(
+        self,
+        queue: asyncio.Queue,
+        records: Callable[..., Iterable[dict]],
+        writer: GVMSyslogWriter,
+        force: bool,
+    ):
+        while True:
+            self.stats.check()
+            # Waiting for the next page is the time the download is behind
+            with self.stats.stage("ingest"):
+                page = await queue.get()
+            if page is None:
+                return
+            if isinstance(page, Exception):
+                raise page
+            await self.__in_executor(self.__output_page, writer, records, page, force)
+
+    @staticmethod
+    def __open(writer: GVMSyslogWriter, transaction, output_file: str):
+        transaction.__enter__()
+        try:
+            writer.add_sink(output_file, "w")
+        except BaseException as e:
+            writer.close(discard=True)
+            transaction.__exit__(type(e), e, e.__traceback__)
+            raise
+
+    @staticmethod
+    def __close(
+        writer: GVMSyslogWriter,
+        transaction,
+        error: BaseException | None = None,
+        publish: Callable[[], None] | None = None,
+    ):
+        # The ship index only commits once the output is complete and published
+        try:
+            writer.close(discard=error is not None)
+            if error is None and publish is not None:
+                publish()
+        except BaseException as e:
+            transaction.__exit__(type(e), e, e.__traceback__)
+            raise
+        if error is None:
+            transaction.__exit__(None, None, None)
+        else:
+            transaction.__exit__(type(error), error, error.__traceback__)
+
+    def __output_page(
+        self,
+        writer: GVMSyslogWriter,
+        records: Callable[..., Iterable[dict]],
+        page,
+        force: bool,
+    ):
+        page_records = records(page)
+        if self.ship_index is not None:
+            page_records = self.ship_index.filter(page_records, force)
+        writer.write_all(page_records)
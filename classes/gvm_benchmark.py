@@ -0,0 +1,127 @@
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import time
+from datetime import datetime
+from pathlib import Path
+from config import Config
+from libraries import GVMLogger, GVMShipStats
+from libraries.synthetic import GVMReportGenerator
+from classes.gvm_report import GVMReport
+
+
+class GVMBenchmark:
+    SIZES = [10000, 100000, 1000000]
+
+    def __init__(
+        self,
+        logger: GVMLogger,
+        results_path: Path | str | None = None,
+        data_path: Path | str | None = None,
+        engine: str | None = None,
+        seed: int = 0,
+    ):
+        self.results_path: Path = Path(results_path or Config.BENCHMARK_PATH)
+        self.data_path: Path = Path(data_path or f"{Config.CACHE_PATH}/benchmark")
+        self.engine = engine or Config.REPORT_ENGINE
+        self.seed = seed
+        self.__write_log: function = logger.write_log
+
+    def dataset(self, rows: int) -> Path:
+        # Generating the large reports takes longer than processing them, so they are kept
+        path = self.data_path / f"synthetic-{rows}-{self.seed}.csv"
+        if not path.exists():
+            self.__write_log(f"Generating a report of {rows} rows", GVMLogger.INFO)
+            temp_path = path.with_suffix(".tmp")
+            GVMReportGenerator(rows, self.seed).write_csv(temp_path)
+            os.replace(temp_path, path)
+        return path
+
+    def run(self, sizes: list[int] = SIZES) -> tuple[dict, dict | None]:
+        previous = self.latest()
+        benchmark = {
+            "started": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "engine": self.engine,
+            "chunk_size": Config.REPORT_CHUNK_SIZE,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "results": [self.measure(self.dataset(rows), rows) for rows in sizes],
+        }
+
+        self.results_path.mkdir(parents=True, exist_ok=True)
+        path = self.results_path / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+        path.write_text(json.dumps(benchmark, indent=2))
+        self.__write_log(f"Benchmark results saved to {path}", GVMLogger.INFO)
+        return benchmark, previous
+
+    def latest(self) -> dict | None:
+        paths = sorted(self.results_path.glob("*.json"))
+        if not paths:
+            return None
+        return json.loads(paths[-1].read_text())
+
+    def measure(self, csv_file: Path, rows: int) -> dict:
+        # Every size runs in a fresh process, so its peak memory is its own
+        context = multiprocessing.get_context("fork")
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=self.__measure, args=[csv_file, rows, sender])
+        process.start()
+        sender.close()
+        try:
+            result = receiver.recv()
+        except EOFError:
+            result = None
+        process.join()
+
+        if result is None or process.exitcode != 0:
+            raise RuntimeError(
+                f"Benchmark of {rows} rows failed with exit code {process.exitcode}"
+            )
+        if "error" in result:
+            raise RuntimeError(f"Benchmark of {rows} rows failed: {result['error']}")
+        self.__write_log(f"Benchmark of {rows} rows: {result}", GVMLogger.INFO)
+        return result
+
+    def __measure(self, csv_file: Path, rows: int, sender):
+        try:
+            stats = GVMShipStats()
+            report = GVMReport(host_name=Config.HOST, engine=self.engine, stats=stats)
+            output_file = self.data_path / f"output-{os.getpid()}"
+            baseline = self.__rss()
+
+            started = time.perf_counter()
+            report.output_data(
+                report.process_data(str(csv_file), Config.REPORT_CHUNK_SIZE),
+                str(output_file),
+            )
+            elapsed = time.perf_counter() - started
+            output_file.unlink()
+
+            # ru_maxrss is in kilobytes on Linux
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            sender.send(
+                {
+                    "rows": rows,
+                    "input_bytes": csv_file.stat().st_size,
+                    "records": stats.rows_out,
+                    "bytes_written": stats.bytes_written,
+                    "seconds": round(elapsed, 3),
+                    "stages": stats.to_dict()["stages"],
+                    "rows_per_second": round(rows / elapsed),
+                    "records_per_second": round(stats.rows_out / elapsed),
+                    "bytes_per_second": round(stats.bytes_written / elapsed),
+                    "peak_rss_bytes": peak,
+                    "peak_rss_growth_bytes": max(peak - baseline, 0),
+                }
+            )
+        except Exception as e:
+            sender.send({"error": f"{type(e).__name__}: {e}"})
+        finally:
+            sender.close()
+
+    @staticmethod
+    def __rss() -> int:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
@@ -0,0 +1,359 @@
+import csv
+import io
+import os
+import random
+import re
+import socketserver
+import threading
+import time
+import uuid
+from base64 import b64encode
+from pathlib import Path
+from lxml import etree
+from libraries import GVMLogger
+from libraries.gmp_results import CSV_COLUMNS
+from libraries.synthetic import GVMReportGenerator, record_to_result
+
+
+class GVMFakeGvmd:
+    CSV_REPORT_FORMAT_ID = "c1645568-627a-11e3-a660-406186ea4fc5"
+    XML_REPORT_FORMAT_ID = "a994b278-1f62-11e1-96ac-406186ea4fc5"
+    # Plural of the get_* commands, and the element of a single entity
+    ENTITIES = {
+        "targets": "target",
+        "credentials": "credential",
+        "configs": "config",
+        "port_lists": "port_list",
+        "alerts": "alert",
+        "schedules": "schedule",
+        "tags": "tag",
+        "filters": "filter",
+        "report_formats": "report_format",
+        "scanners": "scanner",
+        "users": "user",
+        "roles": "role",
+        "groups": "group",
+        "tickets": "ticket",
+        "tasks": "task",
+    }
+    FILTER_PATTERN = re.compile(r'([\w-]+)=("[^"]*"|[^\s,]*)')
+
+    def __init__(
+        self,
+        socket_path: Path | str,
+        logger: GVMLogger,
+        tasks: int = 2,
+        results: int = 1000,
+        latency: float = 0.0,
+        result_latency: float = 0.0,
+        seed: int = 0,
+        username: str | None = None,
+        password: str | None = None,
+    ):
+        self.socket_path: Path = Path(socket_path)
+        self.results = results
+        self.latency = latency
+        self.result_latency = result_latency
+        self.seed = seed
+        self.username = username
+        self.password = password
+        self.__write_log: function = logger.write_log
+
+        self.__lock = threading.Lock()
+        self.__rng = random.Random(seed)
+        self.__server: socketserver.ThreadingUnixStreamServer | None = None
+        self.entities: dict[str, dict[str, dict]] = {
+            entity: {} for entity in self.ENTITIES.values()
+        }
+        self.reports: dict[str, dict] = {}
+
+        for name, format_id in [
+            ("CSV Results", self.CSV_REPORT_FORMAT_ID),
+            ("XML", self.XML_REPORT_FORMAT_ID),
+        ]:
+            self.entities["report_format"][format_id] = {"name": name}
+        self.__create("scanner", "OpenVAS Default")
+        self.__create("config", "Full and fast")
+        self.__create("port_list", "All IANA assigned TCP")
+        for index in range(tasks):
+            task_id = self.__create("task", f"Synthetic task {index + 1}")
+            self.__add_report(task_id)
+
+    def __new_id(self) -> str:
+        return str(uuid.UUID(int=self.__rng.getrandbits(128), version=4))
+
+    def __create(self, entity: str, name: str) -> str:
+        entity_id = self.__new_id()
+        self.entities[entity][entity_id] = {"name": name}
+        return entity_id
+
+    def __add_report(self, task_id: str) -> str:
+        task = self.entities["task"][task_id]
+        report_id = self.__new_id()
+        self.reports[report_id] = {
+            "task_id": task_id,
+            "modified": time.time(),
+            "generator": GVMReportGenerator(
+                self.results,
+                seed=self.seed + len(self.reports),
+                task_id=task_id,
+                task_name=task["name"],
+            ),
+        }
+        task["last_report"] = report_id
+        return report_id
+
+    def start(self) -> "GVMFakeGvmd":
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self.socket_path.unlink(missing_ok=True)
+        self.__server = socketserver.ThreadingUnixStreamServer(
+            str(self.socket_path), self.__handler()
+        )
+        self.__server.daemon_threads = True
+        # gvm-script runs as ALT_USER, not as the user that started the server
+        os.chmod(self.socket_path, 0o666)
+        threading.Thread(
+            target=self.__server.serve_forever, name="gvm-fake-gvmd", daemon=True
+        ).start()
+        self.__write_log(
+            f"Fake gvmd listening on {self.socket_path} ({len(self.reports)} reports "
+            f"of {self.results} results, {self.latency}s latency)",
+            GVMLogger.INFO,
+        )
+        return self
+
+    def shutdown(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+        self.socket_path.unlink(missing_ok=True)
+
+    def __handler(self):
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                authenticated = False
+                while True:
+                    command = fake.read_command(self.request)
+                    if command is None:
+                        return
+                    if command.tag == "authenticate":
+                        authenticated = fake.authenticate(command)
+                        response = fake.authenticate_response(authenticated)
+                    elif command.tag != "get_version" and not authenticated:
+                        response = fake.status(command.tag, 401, "Authenticate first")
+                    else:
+                        response = fake.respond(command)
+                    self.request.sendall(etree.tostring(response))
+
+        return Handler
+
+    @staticmethod
+    def read_command(connection) -> etree._Element | None:
+        # GMP clients wait for every response, so one complete element is one command
+        parser = etree.XMLPullParser(events=("start", "end"), huge_tree=True)
+        depth = 0
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                return None
+            parser.feed(data)
+            for event, _ in parser.read_events():
+                depth += 1 if event == "start" else -1
+                if depth == 0:
+                    return parser.close()
+
+    def authenticate(self, command: etree._Element) -> bool:
+        if self.username is None:
+            return True
+        return (
+            command.findtext("credentials/username") == self.username
+            and command.findtext("credentials/password") == self.password
+        )
+
+    def authenticate_response(self, authenticated: bool) -> etree._Element:
+        if not authenticated:
+            return self.status("authenticate", 400, "Authentication failed")
+        response = self.status("authenticate", 200, "OK")
+        etree.SubElement(response, "role").text = "Admin"
+        etree.SubElement(response, "timezone").text = "UTC"
+        return response
+
+    @staticmethod
+    def status(command: str, status: int, text: str, **attributes) -> etree._Element:
+        return etree.Element(
+            f"{command}_response", status=str(status), status_text=text, **attributes
+        )
+
+    def __filter(self, command: etree._Element) -> dict:
+        return {
+            key: value.strip('"')
+            for key, value in self.FILTER_PATTERN.findall(command.get("filter") or "")
+        }
+
+    def __sleep(self, results: int = 0):
+        delay = self.latency + self.result_latency * results
+        if delay > 0:
+            time.sleep(delay)
+
+    def respond(self, command: etree._Element) -> etree._Element:
+        # Reports are rendered outside the lock, so parallel page fetches overlap
+        if command.tag == "get_reports":
+            response, results = self.__get_reports(command)
+        else:
+            with self.__lock:
+                response, results = self.__respond(command), 0
+        self.__sleep(results)
+        return response
+
+    def __respond(self, command: etree._Element) -> etree._Element:
+        tag = command.tag
+        if tag == "get_version":
+            response = self.status(tag, 200, "OK")
+            etree.SubElement(response, "version").text = "22.5"
+        elif tag == "get_tasks":
+            response = self.__get_entities(command, "task", self.__task_details)
+        elif tag.startswith("get_") and tag[4:] in self.ENTITIES:
+            response = self.__get_entities(command, self.ENTITIES[tag[4:]])
+        elif tag.startswith("create_") and tag[7:] in self.entities:
+            entity_id = self.__create(tag[7:], command.findtext("name") or "")
+            response = self.status(tag, 201, "OK, resource created", id=entity_id)
+        elif tag.startswith("delete_") and tag[7:] in self.entities:
+            entity = tag[7:]
+            found = self.entities[entity].pop(command.get(f"{entity}_id"), None)
+            response = (
+                self.status(tag, 200, "OK")
+                if found is not None
+                else self.status(tag, 404, f"Failed to find {entity}")
+            )
+        elif tag.startswith("modify_") and tag[7:] in self.entities:
+            response = self.status(tag, 200, "OK")
+        elif tag == "start_task":
+            response = self.__start_task(command)
+        elif tag in ["stop_task", "resume_task", "empty_trashcan", "empty_trash"]:
+            response = self.status(tag, 200, "OK")
+        else:
+            response = self.status(tag, 400, "Bogus command name")
+        return response
+
+    def __task_details(self, element: etree._Element, task: dict):
+        etree.SubElement(element, "status").text = "Done"
+        if task.get("last_report"):
+            last_report = etree.SubElement(element, "last_report")
+            etree.SubElement(last_report, "report", id=task["last_report"])
+
+    def __get_entities(
+        self, command: etree._Element, entity: str, details=None
+    ) -> etree._Element:
+        filters = self.__filter(command)
+        entity_id = command.get(f"{entity}_id") or filters.get("uuid")
+        name = filters.get("name")
+
+        matches = [
+            (key, value)
+            for key, value in self.entities[entity].items()
+            if (entity_id is None or key == entity_id)
+            and (name is None or value["name"] == name)
+        ]
+        first = max(int(filters.get("first") or 1), 1)
+        rows = int(filters.get("rows") or -1)
+        matches = (
+            matches[first - 1 :] if rows < 0 else matches[first - 1 : first - 1 + rows]
+        )
+
+        response = self.status(command.tag, 200, "OK")
+        for key, value in matches:
+            element = etree.SubElement(response, entity, id=key)
+            etree.SubElement(element, "name").text = value["name"]
+            if details is not None:
+                details(element, value)
+        return response
+
+    def __start_task(self, command: etree._Element) -> etree._Element:
+        task_id = command.get("task_id")
+        if task_id not in self.entities["task"]:
+            return self.status(command.tag, 404, "Failed to find task")
+        # Scans finish right away, the new report is the task's last report
+        response = self.status(command.tag, 202, "OK, request submitted")
+        etree.SubElement(response, "report_id").text = self.__add_report(task_id)
+        return response
+
+    def __get_reports(self, command: etree._Element) -> tuple[etree._Element, int]:
+        filters = self.__filter(command)
+        report_id = command.get("report_id")
+        response = self.status(command.tag, 200, "OK")
+
+        if report_id is None:
+            # Report listings, e.g. the latest finished report
+            with self.__lock:
+                reports = list(self.reports.items())
+            reports = sorted(
+                reports,
+                key=lambda item: item[1]["modified"],
+                reverse=filters.get("sort-reverse") == "modified",
+            )
+            first = max(int(filters.get("first") or 1), 1)
+            rows = int(filters.get("rows") or -1)
+            if rows >= 0:
+                reports = reports[first - 1 : first - 1 + rows]
+            for key, report in reports:
+                outer = etree.SubElement(response, "report", id=key)
+                inner = etree.SubElement(outer, "report", id=key)
+                etree.SubElement(inner, "scan_run_status").text = "Done"
+                self.__result_count(inner, report["generator"].rows)
+            return response, 0
+
+        report = self.reports.get(report_id)
+        format_id = command.get("format_id") or self.XML_REPORT_FORMAT_ID
+        if report is None:
+            return (
+                self.status(command.tag, 404, f"Failed to find report '{report_id}'"),
+                0,
+            )
+        if format_id not in [self.CSV_REPORT_FORMAT_ID, self.XML_REPORT_FORMAT_ID]:
+            return self.status(command.tag, 404, "Failed to find report format"), 0
+
+        generator: GVMReportGenerator = report["generator"]
+        if command.get("ignore_pagination") == "1":
+            first, rows = 1, generator.rows
+        else:
+            first = max(int(filters.get("first") or 1), 1)
+            rows = int(filters.get("rows") or 100)
+            rows = generator.rows if rows < 0 else rows
+        details = command.get("details") != "0"
+        # Injected per result latency stands in for gvmd rendering the page
+        count = len(range(first - 1, min(first - 1 + rows, generator.rows)))
+
+        outer = etree.SubElement(response, "report", id=report_id, format_id=format_id)
+        if format_id == self.CSV_REPORT_FORMAT_ID and details:
+            # Every page of the CSV format starts with the header row
+            content = io.StringIO()
+            writer = csv.writer(content)
+            writer.writerow(CSV_COLUMNS)
+            writer.writerows(generator.iter_rows(first - 1, rows))
+            report_format = etree.SubElement(outer, "report_format", id=format_id)
+            etree.SubElement(report_format, "name").text = "CSV Results"
+            report_format.tail = b64encode(content.getvalue().encode()).decode()
+            return response, count
+
+        inner = etree.SubElement(outer, "report", id=report_id)
+        task = etree.SubElement(inner, "task", id=generator.task_id)
+        etree.SubElement(task, "name").text = generator.task_name
+        etree.SubElement(inner, "timestamp").text = generator.timestamp
+        etree.SubElement(inner, "scan_run_status").text = "Done"
+        if details:
+            results = etree.SubElement(
+                inner, "results", start=str(first), max=str(rows)
+            )
+            for record in generator.iter_records(first - 1, rows):
+                results.append(record_to_result(record))
+        self.__result_count(inner, generator.rows)
+        return response, count if details else 0
+
+    @staticmethod
+    def __result_count(report: etree._Element, count: int):
+        result_count = etree.SubElement(report, "result_count")
+        etree.SubElement(result_count, "full").text = str(count)
+        etree.SubElement(result_count, "filtered").text = str(count)
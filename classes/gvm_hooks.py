@@ -1,81 +1,302 @@
 from flask import *
-import os
-import threading
-from libraries import GVMLogger
+import asyncio
+import queue
+import re
+import time
+from libraries import GVMLogger, GVMShipStats
+from libraries.allowlist import GVMAllowList
+from libraries.common import is_uuid
+from libraries.logs import CORRELATION_ID
+from libraries.metrics import (
+    HOOK_REQUEST_DURATION,
+    HOOK_REQUESTS,
+    METRICS,
+    GVMGauge,
+)
 from config import Config
 from classes.gvm_report import GVMReport
+from classes.gvm_async_report import GVMAsyncReport
+from classes.gvm_pool import GVMAsyncConnectionPool, GVMConnectionPool
+from classes.gvm_jobs import GVMJobStore, GVMShipJob
+from classes.gvm_workers import GVMAsyncWorkerPool, GVMWorkerPool
+from classes.gvm_workspace import GVMWorkspaceManager
 
 
 class GVMHooks:
+    # Correlation IDs end up in log lines and the environment of the scripts
+    CORRELATION_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+    ENGINES = ["threads", "asyncio"]
+
     def __init__(
         self,
         whitelist: bool = True,
-        allowed_ips: list = ["127.0.0.1"],
+        allowed_ips: GVMAllowList | None = None,
         host: str = "127.0.0.1",
         port: int = 5000,
     ):
-        self.allowed_ips = allowed_ips
+        logger = GVMLogger.get(__name__, Config.HOOKS_LOG_FILE)
+        self.__write_log = logger.write_log
+
+        # Reloaded by the requests whenever ALLOWED_IP_FILE changes
+        self.allowed_ips = allowed_ips or GVMAllowList(
+            Config.ALLOWED_IP_FILE, logger, Config.ALLOWED_IP_RELOAD_INTERVAL
+        )
         self.app = Flask(__name__)
         self.port = port
         self.host = host
         self.setup_routes()
         self.whitelist = whitelist
 
-        self.__write_log = GVMLogger(__name__, Config.HOOKS_LOG_FILE).write_log
+        self.engine = Config.HOOKS_ENGINE
+        if self.engine not in self.ENGINES:
+            raise ValueError(f"Unknown hooks engine: {self.engine}")
+        self.jobs = GVMJobStore(Config.JOB_STORE_FILE, logger)
+
+        # Connections are opened lazily, so gunicorn workers never share a socket
+        self.gmp_pool = None
+        if self.engine == "asyncio":
+            if Config.GMP_POOL_SIZE > 0:
+                self.gmp_pool = GVMAsyncConnectionPool(logger)
+            self.workers = GVMAsyncWorkerPool(logger, self.jobs)
+        else:
+            if Config.GMP_POOL_SIZE > 0:
+                self.gmp_pool = GVMConnectionPool(logger)
+            self.workers = GVMWorkerPool(logger, self.jobs)
+        self.workspaces = GVMWorkspaceManager(logger)
+        METRICS.register(
+            GVMGauge(
+                "gvm_jobs",
+                "Shipping jobs in the job store by state",
+                ("state",),
+                function=self.__job_counts,
+            )
+        )
 
     def set_whitelist(self, status: bool):
         self.whitelist = status
 
-    def set_allowed_ips(self, allowed_ips: list):
-        self.allowed_ips = allowed_ips
+    def set_allowed_ips(self, allowed_ips: list[str]):
+        self.allowed_ips.set_entries(allowed_ips)
 
     def setup_routes(self):
-        @self.app.route("/")
-        def test():
-            if self.whitelist and (request.remote_addr not in self.allowed_ips):
+        @self.app.before_request
+        def start_timer():
+            g.started = time.perf_counter()
+            correlation_id = request.headers.get("X-Correlation-ID", "")
+            if not self.CORRELATION_PATTERN.fullmatch(correlation_id):
+                correlation_id = GVMLogger.new_correlation_id()
+            g.correlation_id = correlation_id
+            CORRELATION_ID.set(correlation_id)
+
+        @self.app.before_request
+        def check_whitelist():
+            if self.whitelist and not self.allowed_ips.allows(request.remote_addr):
                 self.__write_log(
                     f"Refused connection from {request.remote_addr}", GVMLogger.WARN
                 )
                 abort(403)
+
+        @self.app.after_request
+        def count_request(response: Response):
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            HOOK_REQUESTS.inc(route=route, status=response.status_code)
+            HOOK_REQUEST_DURATION.observe(time.perf_counter() - g.started, route=route)
+            response.headers["X-Correlation-ID"] = g.correlation_id
+            return response
+
+        @self.app.teardown_request
+        def clear_correlation_id(error):
+            # gunicorn reuses the thread for the next request
+            CORRELATION_ID.set(None)
+
+        @self.app.route("/metrics")
+        def metrics():
+            if not Config.METRICS_ENABLED:
+                abort(404)
+            return Response(
+                METRICS.render(Config.METRICS_PATH),
+                mimetype="text/plain; version=0.0.4",
+            )
+
+        @self.app.route("/")
+        def test():
             self.__write_log("Gvm hook is being tested")
             return "Flask hooks is running\n"
 
         @self.app.route("/api/report/latest")
         def latest_report():
-            if self.whitelist and (request.remote_addr not in self.allowed_ips):
-                self.__write_log(
-                    f"Refused connection from {request.remote_addr}", GVMLogger.WARN
-                )
-                abort(403)
+            force = self.__force_requested()
+            self.__write_log(
+                f"Gvm hook is called to ship latest report data{' (forced)' if force else ''}"
+            )
+            return self.__ship_in_background(force=force)
+
+        @self.app.route("/api/report/<report_id>")
+        def report(report_id: str):
+            if not is_uuid(report_id):
+                abort(400)
+
+            force = self.__force_requested()
+            self.__write_log(
+                f"Gvm hook is called to ship report {report_id}{' (forced)' if force else ''}"
+            )
+            return self.__ship_in_background(force=force, report_id=report_id)
 
-            self.__write_log("Gvm hook is called to ship latest report data")
-            report = GVMReport(host_name=Config.HOST)
-            thread = threading.Thread(
-                target=report.ship_data, args=[f"{Config.CACHE_PATH}/temp"]
+        @self.app.route("/api/task/<task>/report")
+        def task_report(task: str):
+            # gvmd only fills in the task name ($n) of HTTP Get alert URLs
+            force = self.__force_requested()
+            self.__write_log(
+                f"Gvm hook is called to ship latest report of task {task}{' (forced)' if force else ''}"
             )
-            thread.start()
+            return self.__ship_in_background(force=force, task=task)
 
-            return "Acknowledged\n"
+        @self.app.route("/api/jobs")
+        def jobs():
+            state = request.args.get("state")
+            limit = request.args.get("limit", 50, type=int)
+            return jsonify(
+                [job.to_dict() for job in self.jobs.list_jobs(state, max(limit, 1))]
+            )
 
-    def run(self, **kwargs):
-        self.app.run(host=self.host, port=self.port, **kwargs)
-        self.__write_log(f"Gvm hooks running at http://{self.host}:{self.port}\n")
+        @self.app.route("/api/jobs/<job_id>", methods=["GET", "DELETE"])
+        def job_status(job_id: str):
+            if request.method == "GET":
+                job = self.jobs.get(job_id)
+                if job is None:
+                    abort(404)
+                return jsonify(job.to_dict())
+
+            job = self.jobs.request_cancel(job_id)
+            if job is None:
+                abort(404)
+            if job.state == GVMShipJob.RUNNING:
+                # Only reaches the job right away when it runs in this process,
+                # the other workers notice the request with their next poll
+                self.workers.cancel(job_id)
+            elif job.state != GVMShipJob.CANCELLED:
+                return jsonify(job.to_dict()), 409
+            self.__write_log(f"Cancel requested for job {job_id}", GVMLogger.INFO)
+            return jsonify(job.to_dict())
 
-    def _load_allowed_ips(self, file_path: str):
-        if not file_path or not os.path.isfile(file_path):
-            return ["127.0.0.1"]
+    def __job_counts(self) -> dict[tuple, int]:
+        counts = {(state,): 0 for state in [GVMShipJob.QUEUED, GVMShipJob.RUNNING]}
+        for state, count in self.jobs.counts().items():
+            counts[(state,)] = count
+        return counts
 
-        allowed_ips = []
+    def __force_requested(self) -> bool:
+        return request.args.get("force", "").lower() in ["1", "true", "yes"]
+
+    def __resolve_report_id(self, task: str | None) -> str | None:
+        # One cheap GMP query, so latest and task triggers coalesce and debounce on the
+        # report they are about like report triggers do
+        if self.gmp_pool is None:
+            return None
         try:
-            with open(file_path, "r") as file:
-                allowed_ips = [line.strip() for line in file if line.strip()]
+            if self.engine == "asyncio":
+                # The async pool only lives on the event loop of the shipping workers
+                if self.workers.loop is None:
+                    return None
+                report = GVMAsyncReport(host_name=Config.HOST, pool=self.gmp_pool)
+                lookup = asyncio.run_coroutine_threadsafe(
+                    (
+                        report.get_task_report_id_async(task)
+                        if task
+                        else report.get_latest_report_id_async()
+                    ),
+                    self.workers.loop,
+                )
+                try:
+                    return lookup.result(Config.GMP_TIMEOUT)
+                except BaseException:
+                    lookup.cancel()
+                    raise
+
+            report = GVMReport(host_name=Config.HOST, pool=self.gmp_pool)
+            return (
+                report.get_task_report_id(task)
+                if task
+                else report.get_latest_report_id()
+            )
         except Exception as e:
+            # The job looks the report up again when it runs
             self.__write_log(
-                f"Error reading allowed IPs from file: {e}\n", GVMLogger.ERROR
+                f"Could not look up the report of the trigger, queuing it as is: {e}",
+                GVMLogger.WARN,
+            )
+            return None
+
+    def __ship_in_background(self, **kwargs) -> str:
+        if not kwargs.get("report_id"):
+            report_id = self.__resolve_report_id(kwargs.get("task"))
+            if report_id:
+                self.__write_log(f"Trigger is about report {report_id}", GVMLogger.INFO)
+                kwargs = {"force": kwargs.get("force", False), "report_id": report_id}
+
+        try:
+            job, relation = self.jobs.enqueue(kwargs, g.correlation_id)
+        except queue.Full as e:
+            self.__write_log(f"Refused shipping request, {e}", GVMLogger.WARN)
+            abort(
+                Response(
+                    "Too many pending shipments, retry later\n",
+                    status=503,
+                    headers={"Retry-After": str(Config.HOOKS_RETRY_AFTER)},
+                )
             )
-            allowed_ips = ["127.0.0.1"]
 
-        return allowed_ips
+        if relation == "queued as":
+            self.workers.wake()
+        return self.__acknowledge(job, relation)
+
+    def __acknowledge(self, job: GVMShipJob, relation: str) -> str:
+        self.__write_log(
+            f"Shipping request for {job.key} {relation} job {job.id}", GVMLogger.INFO
+        )
+        return f"Acknowledged, {relation} job {job.id}\n"
+
+    def __ship(self, job: GVMShipJob, stats: GVMShipStats):
+        report = GVMReport(
+            host_name=Config.HOST,
+            pool=self.gmp_pool,
+            process_pool=self.workers.process_pool,
+            stats=stats,
+        )
+        # The output is staged in the workspace and appended to OUTPUT_PATH once complete
+        with self.workspaces.workspace(f"job-{job.id}") as workspace:
+            report.ship_data(str(workspace / "output"), **job.params)
+
+    async def __ship_async(self, job: GVMShipJob, stats: GVMShipStats):
+        report = GVMAsyncReport(
+            host_name=Config.HOST,
+            pool=self.gmp_pool,
+            process_pool=self.workers.process_pool,
+            executor=self.workers.executor,
+            stats=stats,
+        )
+        with self.workspaces.workspace(f"job-{job.id}") as workspace:
+            await report.ship_data_async(str(workspace / "output"), **job.params)
+
+    def start_workers(self):
+        if self.engine == "asyncio":
+            self.workers.start(self.__ship_async)
+        else:
+            self.workers.start(self.__ship)
+
+    def stop_workers(self, timeout: float | None = None):
+        if timeout is None:
+            timeout = Config.HOOKS_DRAIN_TIMEOUT
+        self.__write_log(
+            f"Draining shipping workers (up to {timeout}s)", GVMLogger.INFO
+        )
+        if self.workers.shutdown(timeout=timeout):
+            self.__write_log("Shipping workers drained", GVMLogger.INFO)
+
+    def run(self, **kwargs):
+        self.start_workers()
+        self.app.run(host=self.host, port=self.port, **kwargs)
+        self.__write_log(f"Gvm hooks running at http://{self.host}:{self.port}\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+import fcntl
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator
+from config import Config
+from libraries import GVMLogger
+
+
+class GVMShipIndex:
+    BATCH_SIZE = 500
+    # Compact once this share of the database pages is free after evictions
+    COMPACT_RATIO = 0.25
+    # Jobs of the same report are serialized on one of this many lock files
+    LOCK_STRIPES = 64
+
+    def __init__(
+        self,
+        index_file: Path | str,
+        logger: GVMLogger,
+        max_age_days: float | None = None,
+    ):
+        self.index_file: Path = Path(index_file)
+        self.max_age_days = (
+            max_age_days if max_age_days is not None else Config.SHIP_INDEX_MAX_AGE_DAYS
+        )
+        self.emitted = 0
+        self.skipped = 0
+        self.__write_log: function = logger.write_log
+        self.__connection: sqlite3.Connection | None = None
+        self.__run_started = 0.0
+        self.__locks: list = []
+
+    def __connect(self) -> sqlite3.Connection:
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        # The asyncio engine hands a transaction from one executor thread to the next
+        connection = sqlite3.connect(
+            self.index_file, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS shipped (
+                result_id TEXT NOT NULL,
+                reference TEXT NOT NULL,
+                first_shipped REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (result_id, reference)
+            ) WITHOUT ROWID
+            """)
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS shipped_last_seen ON shipped (last_seen)"
+        )
+        return connection
+
+    @staticmethod
+    def key(entry: dict) -> tuple[str, str]:
+        reference = "|".join(
+            entry.get(name) or "" for name in ("CERTs", "CVEs", "BIDs")
+        )
+        return entry.get("Result ID") or "", reference
+
+    def __lock_files(self, report_id: str | None) -> list[tuple[Path, int]]:
+        lock_dir = self.index_file.with_name(f"{self.index_file.name}-locks")
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        if not report_id:
+            # A job that has not resolved its report may ship any of them
+            return [(lock_dir / "all.lock", fcntl.LOCK_EX)]
+        stripe = zlib.crc32(report_id.encode()) % self.LOCK_STRIPES
+        return [
+            (lock_dir / "all.lock", fcntl.LOCK_SH),
+            (lock_dir / f"{stripe}.lock", fcntl.LOCK_EX),
+        ]
+
+    def acquire(self, report_id: str | None, blocking: bool = True) -> bool:
+        # Two jobs of the same report would both find its keys unshipped, the lock is
+        # held from the first filtered batch until the keys are merged
+        if self.__locks:
+            return True
+        for lock_file, operation in self.__lock_files(report_id):
+            file = open(lock_file, "a")
+            self.__locks.append(file)
+            try:
+                fcntl.flock(file, operation if blocking else operation | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.release()
+                return False
+            except BaseException:
+                self.release()
+                raise
+        return True
+
+    def release(self):
+        for file in self.__locks:
+            file.close()
+        self.__locks = []
+
+    @contextmanager
+    def transaction(self, report_id: str | None = None):
+        # Keys seen while filtering are staged in a temporary table and only merged into
+        # the index once the output is written, the write lock is held for the merge only
+        if not self.acquire(report_id, blocking=False):
+            self.__write_log(
+                f"Waiting for another job shipping report {report_id or '(any)'}",
+                GVMLogger.INFO,
+            )
+            self.acquire(report_id)
+        try:
+            with self.__transaction():
+                yield self
+        finally:
+            self.release()
+
+    @contextmanager
+    def __transaction(self):
+        self.__connection = self.__connect()
+        self.__run_started = time.time()
+        self.emitted = 0
+        self.skipped = 0
+        try:
+            self.__connection.execute("""
+                CREATE TEMP TABLE pending (
+                    result_id TEXT NOT NULL,
+                    reference TEXT NOT NULL,
+                    PRIMARY KEY (result_id, reference)
+                ) WITHOUT ROWID
+                """)
+            yield self
+            self.__connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.__connection.execute(
+                    "INSERT INTO shipped (result_id, reference, first_shipped, last_seen) "
+                    "SELECT result_id, reference, ?, ? FROM pending WHERE true "
+                    "ON CONFLICT (result_id, reference) DO UPDATE SET last_seen = excluded.last_seen",
+                    [self.__run_started, self.__run_started],
+                )
+                self.__connection.execute("COMMIT")
+            except BaseException:
+                self.__connection.execute("ROLLBACK")
+                raise
+            self.__write_log(
+                f"Ship index updated ({self.emitted} new, {self.skipped} already shipped)",
+                GVMLogger.INFO,
+            )
+        finally:
+            self.__connection.close()
+            self.__connection = None
+
+    def filter(self, entries: Iterable[dict], force: bool = False) -> Iterator[dict]:
+        if self.__connection is None:
+            raise RuntimeError("GVMShipIndex.filter must run inside transaction()")
+
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= self.BATCH_SIZE:
+                yield from self.__filter_batch(batch, force)
+                batch = []
+        if batch:
+            yield from self.__filter_batch(batch, force)
+
+    def __filter_batch(self, batch: list[dict], force: bool) -> list[dict]:
+        keys = [self.key(entry) for entry in batch]
+
+        shipped = set()
+        if not force:
+            result_ids = list({result_id for result_id, _ in keys})
+            placeholders = ",".join("?" * len(result_ids))
+            # Keys of this run stay in pending until the merge, duplicates within the
+            # report are not mistaken for reships
+            shipped = set(
+                self.__connection.execute(
+                    f"SELECT result_id, reference FROM shipped "
+                    f"WHERE result_id IN ({placeholders})",
+                    result_ids,
+                )
+            )
+
+        self.__connection.executemany(
+            "INSERT OR IGNORE INTO pending (result_id, reference) VALUES (?, ?)", keys
+        )
+
+        new_entries = [entry for entry, key in zip(batch, keys) if key not in shipped]
+        self.emitted += len(new_entries)
+        self.skipped += len(batch) - len(new_entries)
+        return new_entries
+
+    def maintain(self):
+        connection = self.__connect()
+        try:
+            evicted = 0
+            if self.max_age_days > 0:
+                cutoff = time.time() - self.max_age_days * 86400
+                evicted = connection.execute(
+                    "DELETE FROM shipped WHERE last_seen < ?", [cutoff]
+                ).rowcount
+                if evicted:
+                    self.__write_log(
+                        f"Evicted {evicted} ship index entries older than {self.max_age_days} days",
+                        GVMLogger.INFO,
+                    )
+
+            page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+            if page_count and free_pages / page_count >= self.COMPACT_RATIO:
+                connection.execute("VACUUM")
+                self.__write_log(
+                    f"Compacted ship index ({free_pages} of {page_count} pages were free)",
+                    GVMLogger.INFO,
+                )
+        finally:
+            connection.close()
+
+    def reset(self):
+        # Waits for running jobs, their keys would be merged back right after
+        self.acquire(None)
+        connection = self.__connect()
+        try:
+            connection.execute("DELETE FROM shipped")
+            connection.execute("VACUUM")
+            self.__write_log("Ship index cleared", GVMLogger.INFO)
+        finally:
+            connection.close()
+            self.release()
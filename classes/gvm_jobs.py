@@ -0,0 +1,471 @@
+import json
+import os
+import queue
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from config import Config
+from libraries import GVMLogger
+
+
+class GVMShipJob:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, row: sqlite3.Row):
+        self.id: str = row["id"]
+        self.key: str = row["key"]
+        self.params: dict = json.loads(row["params"])
+        self.state: str = row["state"]
+        self.triggers: int = row["triggers"]
+        self.attempts: int = row["attempts"]
+        self.error: str | None = row["error"]
+        self.owner: str | None = row["owner"]
+        self.submitted: float = row["submitted"]
+        self.started: float | None = row["started"]
+        self.finished: float | None = row["finished"]
+        self.next_attempt: float = row["next_attempt"]
+        self.cancel_requested: bool = bool(row["cancel_requested"])
+        self.stats: dict | None = json.loads(row["stats"]) if row["stats"] else None
+        self.correlation_id: str | None = row["correlation_id"]
+
+    @staticmethod
+    def make_key(
+        force: bool = False, report_id: str | None = None, task: str | None = None
+    ) -> str:
+        target = (
+            f"report:{report_id}" if report_id else f"task:{task}" if task else "latest"
+        )
+        return f"{target}:force" if force else target
+
+    @property
+    def active(self) -> bool:
+        return self.state in (self.QUEUED, self.RUNNING)
+
+    def to_dict(self) -> dict:
+        stats = self.stats or {}
+        ended = self.finished if self.finished is not None else time.time()
+        return {
+            "id": self.id,
+            "key": self.key,
+            "state": self.state,
+            "report_id": self.params.get("report_id") or stats.get("report_id"),
+            "task": self.params.get("task"),
+            "force": bool(self.params.get("force")),
+            "triggers": self.triggers,
+            "attempts": self.attempts,
+            "error": self.error,
+            "owner": self.owner,
+            "correlation_id": self.correlation_id,
+            "cancel_requested": self.cancel_requested,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "wall_time": (
+                round(ended - self.started, 3) if self.started is not None else None
+            ),
+            "stats": self.stats,
+        }
+
+
+class GVMJobStore:
+    # Abandoned running jobs go back to the queue, unless they were being cancelled
+    __REQUEUE = (
+        f"state = CASE WHEN cancel_requested THEN '{GVMShipJob.CANCELLED}' "
+        f"ELSE '{GVMShipJob.QUEUED}' END, owner = NULL, finished = CASE "
+        "WHEN cancel_requested THEN (julianday('now') - 2440587.5) * 86400.0 END"
+    )
+
+    def __init__(
+        self,
+        store_file: Path | str,
+        logger: GVMLogger,
+        queue_depth: int | None = None,
+        debounce: float | None = None,
+        lease: float | None = None,
+        max_attempts: int | None = None,
+        retry_backoff: float | None = None,
+        retry_backoff_max: float | None = None,
+        retention_days: float | None = None,
+    ):
+        self.store_file: Path = Path(store_file)
+        self.queue_depth = (
+            queue_depth if queue_depth is not None else Config.HOOKS_QUEUE_DEPTH
+        )
+        self.debounce = debounce if debounce is not None else Config.HOOKS_DEBOUNCE
+        self.lease = lease if lease is not None else Config.HOOKS_JOB_LEASE
+        self.max_attempts = (
+            max_attempts if max_attempts is not None else Config.HOOKS_JOB_MAX_ATTEMPTS
+        )
+        self.retry_backoff = (
+            retry_backoff if retry_backoff is not None else Config.HOOKS_RETRY_BACKOFF
+        )
+        self.retry_backoff_max = (
+            retry_backoff_max
+            if retry_backoff_max is not None
+            else Config.HOOKS_RETRY_BACKOFF_MAX
+        )
+        self.retention_days = (
+            retention_days
+            if retention_days is not None
+            else Config.HOOKS_JOB_RETENTION_DAYS
+        )
+        self.__write_log: function = logger.write_log
+        self.__initialized = False
+
+    def __connect(self) -> sqlite3.Connection:
+        self.store_file.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.store_file, timeout=60, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self.__initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    triggers INTEGER NOT NULL DEFAULT 1,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    owner TEXT,
+                    heartbeat REAL,
+                    submitted REAL NOT NULL,
+                    started REAL,
+                    finished REAL,
+                    next_attempt REAL NOT NULL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    stats TEXT,
+                    correlation_id TEXT
+                )
+                """)
+            # Stores created before job stats, cancelling and correlation IDs existed
+            columns = {
+                row["name"] for row in connection.execute("PRAGMA table_info(jobs)")
+            }
+            if "cancel_requested" not in columns:
+                connection.execute(
+                    "ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0"
+                )
+            if "stats" not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN stats TEXT")
+            if "correlation_id" not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN correlation_id TEXT")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, next_attempt)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+            self.__initialized = True
+        return connection
+
+    @contextmanager
+    def __transaction(self):
+        # Every gunicorn worker opens the same file, BEGIN IMMEDIATE serializes writers
+        connection = self.__connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def enqueue(
+        self, params: dict, correlation_id: str | None = None
+    ) -> tuple[GVMShipJob, str]:
+        key = GVMShipJob.make_key(**params)
+        now = time.time()
+        # The hooks look up the report of latest and task triggers first. Without it,
+        # a job that has already resolved its report may ship an older one than the
+        # trigger is about, so these only attach to queued jobs and are not debounced
+        resolved = bool(params.get("report_id"))
+        states = (
+            [GVMShipJob.QUEUED, GVMShipJob.RUNNING] if resolved else [GVMShipJob.QUEUED]
+        )
+        placeholders = ",".join("?" * len(states))
+
+        with self.__transaction() as connection:
+            row = connection.execute(
+                f"SELECT * FROM jobs WHERE key = ? AND state IN ({placeholders}) "
+                "AND cancel_requested = 0 ORDER BY submitted LIMIT 1",
+                [key, *states],
+            ).fetchone()
+            relation = "attached to"
+
+            if row is None and resolved and not params.get("force"):
+                row = connection.execute(
+                    "SELECT * FROM jobs WHERE key = ? AND state = ? AND finished >= ? "
+                    "ORDER BY finished DESC LIMIT 1",
+                    [key, GVMShipJob.DONE, now - self.debounce],
+                ).fetchone()
+                relation = "debounced by"
+
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET triggers = triggers + 1 WHERE id = ?", [row["id"]]
+                )
+                return GVMShipJob(row), relation
+
+            queued = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = ?", [GVMShipJob.QUEUED]
+            ).fetchone()[0]
+            if queued >= self.queue_depth:
+                raise queue.Full(f"{queued} jobs are already queued")
+
+            job_id = uuid.uuid4().hex[:12]
+            connection.execute(
+                "INSERT INTO jobs (id, key, params, state, submitted, next_attempt, "
+                "correlation_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    job_id,
+                    key,
+                    json.dumps(params),
+                    GVMShipJob.QUEUED,
+                    now,
+                    now,
+                    correlation_id,
+                ],
+            )
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", [job_id]
+            ).fetchone()
+            return GVMShipJob(row), "queued as"
+
+    def claim(self, owner: str) -> GVMShipJob | None:
+        now = time.time()
+        with self.__transaction() as connection:
+            # Jobs of a worker that stopped heartbeating go back to the queue
+            resumed = connection.execute(
+                f"UPDATE jobs SET {self.__REQUEUE} WHERE state = ? AND heartbeat < ?",
+                [GVMShipJob.RUNNING, now - self.lease],
+            ).rowcount
+            if resumed:
+                self.__write_log(
+                    f"Resuming {resumed} jobs of stopped workers", GVMLogger.WARN
+                )
+
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE state = ? AND next_attempt <= ? "
+                "ORDER BY next_attempt, submitted LIMIT 1",
+                [GVMShipJob.QUEUED, now],
+            ).fetchone()
+            if row is None:
+                return None
+
+            connection.execute(
+                "UPDATE jobs SET state = ?, owner = ?, heartbeat = ?, started = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                [GVMShipJob.RUNNING, owner, now, now, row["id"]],
+            )
+            return GVMShipJob(
+                connection.execute(
+                    "SELECT * FROM jobs WHERE id = ?", [row["id"]]
+                ).fetchone()
+            )
+
+    def resume_orphans(self, host: str) -> int:
+        # Owners are "host:pid", jobs of processes on this host that are gone resume now
+        # instead of waiting for their lease to run out
+        with self.__transaction() as connection:
+            orphans = []
+            for row in connection.execute(
+                "SELECT id, owner FROM jobs WHERE state = ? AND owner LIKE ?",
+                [GVMShipJob.RUNNING, f"{host}:%"],
+            ).fetchall():
+                try:
+                    os.kill(int(row["owner"].rpartition(":")[2]), 0)
+                except ProcessLookupError:
+                    orphans.append(row["id"])
+                except (PermissionError, ValueError):
+                    pass
+
+            connection.executemany(
+                f"UPDATE jobs SET {self.__REQUEUE} WHERE id = ?",
+                [(job_id,) for job_id in orphans],
+            )
+        if orphans:
+            self.__write_log(
+                f"Resuming {len(orphans)} jobs left running by stopped workers",
+                GVMLogger.WARN,
+            )
+        return len(orphans)
+
+    def release(self, owner: str) -> int:
+        # Handed back by a draining worker, the interrupted attempt does not count
+        with self.__transaction() as connection:
+            released = connection.execute(
+                f"UPDATE jobs SET {self.__REQUEUE}, attempts = MAX(attempts - 1, 0) "
+                "WHERE state = ? AND owner = ?",
+                [GVMShipJob.RUNNING, owner],
+            ).rowcount
+        if released:
+            self.__write_log(
+                f"Returned {released} unfinished jobs of {owner} to the queue",
+                GVMLogger.WARN,
+            )
+        return released
+
+    def heartbeat(self, owner: str, stats: dict[str, dict] | None = None):
+        # Stats of running jobs are saved along, so the API shows how far they got
+        with self.__transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE owner = ? AND state = ?",
+                [time.time(), owner, GVMShipJob.RUNNING],
+            )
+            connection.executemany(
+                "UPDATE jobs SET stats = ? WHERE id = ? AND owner = ? AND state = ?",
+                [
+                    [json.dumps(job_stats), job_id, owner, GVMShipJob.RUNNING]
+                    for job_id, job_stats in (stats or {}).items()
+                ],
+            )
+
+    def cancel_requests(self, owner: str) -> list[str]:
+        connection = self.__connect()
+        try:
+            return [
+                row["id"]
+                for row in connection.execute(
+                    "SELECT id FROM jobs WHERE owner = ? AND state = ? "
+                    "AND cancel_requested = 1",
+                    [owner, GVMShipJob.RUNNING],
+                )
+            ]
+        finally:
+            connection.close()
+
+    def request_cancel(self, job_id: str) -> GVMShipJob | None:
+        # Queued jobs are cancelled at once, running ones at their next chunk or stage
+        with self.__transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = ?, finished = ? WHERE id = ? AND state = ?",
+                [GVMShipJob.CANCELLED, time.time(), job_id, GVMShipJob.QUEUED],
+            )
+            connection.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = ?",
+                [job_id, GVMShipJob.RUNNING],
+            )
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", [job_id]
+            ).fetchone()
+        return GVMShipJob(row) if row is not None else None
+
+    def complete(self, job: GVMShipJob, stats: dict | None = None):
+        self.__finish(job, GVMShipJob.DONE, None, stats)
+
+    def cancelled(self, job: GVMShipJob, stats: dict | None = None):
+        self.__finish(job, GVMShipJob.CANCELLED, "Cancelled", stats)
+        self.__write_log(f"Job {job.id} was cancelled", GVMLogger.WARN)
+
+    def __finish(
+        self, job: GVMShipJob, state: str, error: str | None, stats: dict | None
+    ):
+        now = time.time()
+        with self.__transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = ?, finished = ?, error = ?, owner = NULL, "
+                "stats = ? WHERE id = ?",
+                [state, now, error, json.dumps(stats) if stats else None, job.id],
+            )
+            if self.retention_days > 0:
+                connection.execute(
+                    "DELETE FROM jobs WHERE state IN (?, ?, ?) AND finished < ?",
+                    [
+                        GVMShipJob.DONE,
+                        GVMShipJob.FAILED,
+                        GVMShipJob.CANCELLED,
+                        now - self.retention_days * 86400,
+                    ],
+                )
+
+    def fail(self, job: GVMShipJob, error: str, stats: dict | None = None):
+        now = time.time()
+        with self.__transaction() as connection:
+            if job.attempts < self.max_attempts:
+                delay = min(
+                    self.retry_backoff * 2 ** (job.attempts - 1),
+                    self.retry_backoff_max,
+                )
+                connection.execute(
+                    "UPDATE jobs SET state = ?, error = ?, owner = NULL, next_attempt = ?, "
+                    "stats = ? WHERE id = ?",
+                    [
+                        GVMShipJob.QUEUED,
+                        error,
+                        now + delay,
+                        json.dumps(stats) if stats else None,
+                        job.id,
+                    ],
+                )
+                self.__write_log(
+                    f"Job {job.id} failed (attempt {job.attempts} of {self.max_attempts}), "
+                    f"retrying in {delay:.0f}s: {error}",
+                    GVMLogger.WARN,
+                )
+            else:
+                connection.execute(
+                    "UPDATE jobs SET state = ?, error = ?, owner = NULL, finished = ?, "
+                    "stats = ? WHERE id = ?",
+                    [
+                        GVMShipJob.FAILED,
+                        error,
+                        now,
+                        json.dumps(stats) if stats else None,
+                        job.id,
+                    ],
+                )
+                self.__write_log(
+                    f"Job {job.id} failed after {job.attempts} attempts: {error}",
+                    GVMLogger.ERROR,
+                )
+
+    def get(self, job_id: str) -> GVMShipJob | None:
+        connection = self.__connect()
+        try:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", [job_id]
+            ).fetchone()
+        finally:
+            connection.close()
+        return GVMShipJob(row) if row is not None else None
+
+    def list_jobs(self, state: str | None = None, limit: int = 50) -> list[GVMShipJob]:
+        connection = self.__connect()
+        try:
+            if state:
+                rows = connection.execute(
+                    "SELECT * FROM jobs WHERE state = ? ORDER BY submitted DESC LIMIT ?",
+                    [state, limit],
+                ).fetchall()
+            else:
+                rows = connection.execute(
+                    "SELECT * FROM jobs ORDER BY submitted DESC LIMIT ?", [limit]
+                ).fetchall()
+        finally:
+            connection.close()
+        return [GVMShipJob(row) for row in rows]
+
+    def counts(self) -> dict[str, int]:
+        connection = self.__connect()
+        try:
+            return dict(
+                connection.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+            )
+        finally:
+            connection.close()
+
+    def count(self, state: str) -> int:
+        connection = self.__connect()
+        try:
+            return connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = ?", [state]
+            ).fetchone()[0]
+        finally:
+            connection.close()
@@ -0,0 +1,251 @@
+import json
+import math
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from config import Config
+from libraries import GVMLogger
+
+
+class GVMLoadTest:
+    SHAPES = ["constant", "burst", "ramp"]
+    ACKNOWLEDGE_PATTERN = re.compile(r"Acknowledged, (.+) job (\w+)")
+    FINISHED_STATES = ["done", "failed", "cancelled"]
+
+    def __init__(
+        self,
+        logger: GVMLogger,
+        base_url: str = f"http://{Config.HOST}:{Config.PORT}",
+        rate: float = 1.0,
+        duration: float = 60.0,
+        shape: str = "constant",
+        burst_size: int = 10,
+        tasks: list[str] | None = None,
+        force: bool = False,
+        concurrency: int = 64,
+        timeout: float = 10.0,
+        completion_timeout: float = 600.0,
+        results_path: Path | str = f"{Config.BENCHMARK_PATH}/load",
+    ):
+        if shape not in self.SHAPES:
+            raise ValueError(f"Unknown load shape: {shape}")
+        self.base_url = base_url.rstrip("/")
+        self.rate = rate
+        self.duration = duration
+        self.shape = shape
+        self.burst_size = burst_size
+        # Triggers are spread over these tasks, a single one measures coalescing
+        self.tasks = tasks or ["Synthetic task 1"]
+        self.force = force
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.completion_timeout = completion_timeout
+        self.results_path: Path = Path(results_path)
+        self.__write_log: function = logger.write_log
+
+        self.__lock = threading.Lock()
+        self.__triggers: list[dict] = []
+        self.__queue_depth: list[tuple[float, int, int]] = []
+
+    def schedule(self) -> list[float]:
+        # Offsets in seconds at which triggers are sent
+        if self.shape == "constant":
+            count = int(self.rate * self.duration)
+            return [index / self.rate for index in range(count)]
+        if self.shape == "burst":
+            # The same average rate, sent as burst_size triggers at once
+            interval = self.burst_size / self.rate
+            bursts = max(int(self.duration / interval), 1)
+            return [
+                index * interval
+                for index in range(bursts)
+                for _ in range(self.burst_size)
+            ]
+        # Ramp from zero up to rate, the nth trigger is due when the area reaches n
+        count = int(self.rate * self.duration / 2)
+        return [
+            math.sqrt(2 * index * self.duration / self.rate) for index in range(count)
+        ]
+
+    def __request(self, path: str, method: str = "GET") -> tuple[int, str]:
+        request = urllib.request.Request(f"{self.base_url}{path}", method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode(errors="replace")
+
+    def __trigger(self, index: int, due: float):
+        task = self.tasks[index % len(self.tasks)]
+        path = f"/api/task/{urllib.request.quote(task)}/report"
+        if self.force:
+            path += "?force=1"
+
+        sent = time.time()
+        try:
+            status, body = self.__request(path)
+        except OSError as e:
+            status, body = None, str(e)
+        acknowledged = time.time()
+
+        match = self.ACKNOWLEDGE_PATTERN.match(body) if status == 200 else None
+        with self.__lock:
+            self.__triggers.append(
+                {
+                    "task": task,
+                    "due": due,
+                    "sent": sent,
+                    "status": status,
+                    # From when the trigger was due, so a backed up client still counts
+                    "ack_latency": acknowledged - due,
+                    "relation": match.group(1) if match else None,
+                    "job": match.group(2) if match else None,
+                    "error": None if match else body.strip()[:200],
+                }
+            )
+
+    def __sample_queue(self, stopping: threading.Event):
+        while not stopping.wait(1):
+            try:
+                queued = len(
+                    json.loads(self.__request("/api/jobs?state=queued&limit=1000")[1])
+                )
+                running = len(
+                    json.loads(self.__request("/api/jobs?state=running&limit=1000")[1])
+                )
+            except (OSError, ValueError):
+                continue
+            with self.__lock:
+                self.__queue_depth.append((time.time(), queued, running))
+
+    def __wait_for_jobs(self, job_ids: set[str]) -> dict[str, dict]:
+        jobs = {}
+        deadline = time.time() + self.completion_timeout
+        pending = set(job_ids)
+        while pending and time.time() < deadline:
+            for job_id in list(pending):
+                try:
+                    status, body = self.__request(f"/api/jobs/{job_id}")
+                except OSError:
+                    continue
+                if status != 200:
+                    continue
+                job = json.loads(body)
+                if job["state"] in self.FINISHED_STATES:
+                    jobs[job_id] = job
+                    pending.discard(job_id)
+            if pending:
+                time.sleep(0.5)
+        return jobs
+
+    @staticmethod
+    def percentiles(values: list[float]) -> dict:
+        if not values:
+            return {}
+        values = sorted(values)
+        result = {}
+        for percentile in [50, 90, 95, 99, 100]:
+            index = min(math.ceil(percentile / 100 * len(values)) - 1, len(values) - 1)
+            result[f"p{percentile}"] = round(values[max(index, 0)], 4)
+        result["mean"] = round(sum(values) / len(values), 4)
+        return result
+
+    def run(self) -> dict:
+        schedule = self.schedule()
+        self.__write_log(
+            f"Load test of {self.base_url}: {len(schedule)} triggers, {self.shape} "
+            f"at {self.rate}/s for {self.duration}s over {len(self.tasks)} tasks",
+            GVMLogger.INFO,
+        )
+        stopping = threading.Event()
+        sampler = threading.Thread(
+            target=self.__sample_queue, args=[stopping], daemon=True
+        )
+        sampler.start()
+
+        # Open loop: triggers go out on schedule however slow the answers are
+        started = time.time()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            for index, offset in enumerate(schedule):
+                due = started + offset
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.__trigger, index, due)
+        sending = time.time() - started
+
+        job_ids = {trigger["job"] for trigger in self.__triggers if trigger["job"]}
+        jobs = self.__wait_for_jobs(job_ids)
+        stopping.set()
+        sampler.join()
+
+        result = self.summarize(schedule, sending, jobs)
+        self.results_path.mkdir(parents=True, exist_ok=True)
+        path = self.results_path / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+        path.write_text(
+            json.dumps({**result, "queue_depth": self.__queue_depth}, indent=2)
+        )
+        self.__write_log(f"Load test results saved to {path}", GVMLogger.INFO)
+        return result
+
+    def summarize(self, schedule: list[float], sending: float, jobs: dict) -> dict:
+        triggers = self.__triggers
+        acknowledged = [trigger for trigger in triggers if trigger["job"]]
+        dropped = [trigger for trigger in triggers if trigger["status"] == 503]
+        errors = [
+            trigger
+            for trigger in triggers
+            if not trigger["job"] and trigger["status"] != 503
+        ]
+        relations = {}
+        for trigger in acknowledged:
+            relations[trigger["relation"]] = relations.get(trigger["relation"], 0) + 1
+
+        # A trigger is complete once the job it was queued as or attached to finished
+        completion = [
+            jobs[trigger["job"]]["finished"] - trigger["due"]
+            for trigger in acknowledged
+            if trigger["job"] in jobs and trigger["relation"] != "debounced by"
+        ]
+        states = {}
+        for job in jobs.values():
+            states[job["state"]] = states.get(job["state"], 0) + 1
+
+        return {
+            "started": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "base_url": self.base_url,
+            "shape": self.shape,
+            "rate": self.rate,
+            "duration": self.duration,
+            "burst_size": self.burst_size if self.shape == "burst" else None,
+            "tasks": len(self.tasks),
+            "force": self.force,
+            "triggers": len(schedule),
+            "send_seconds": round(sending, 3),
+            "achieved_rate": round(len(schedule) / sending, 2) if sending else None,
+            "acknowledged": len(acknowledged),
+            "relations": relations,
+            "dropped": len(dropped),
+            "errors": len(errors),
+            "error_samples": sorted({trigger["error"] for trigger in errors})[:5],
+            "ack_latency": self.percentiles(
+                [trigger["ack_latency"] for trigger in triggers]
+            ),
+            "jobs": len({trigger["job"] for trigger in acknowledged}),
+            "jobs_unfinished": len(
+                {trigger["job"] for trigger in acknowledged} - set(jobs)
+            ),
+            "job_states": states,
+            "completion_latency": self.percentiles(completion),
+            "max_queued": max(
+                (queued for _, queued, _ in self.__queue_depth), default=0
+            ),
+            "max_running": max(
+                (running for _, _, running in self.__queue_depth), default=0
+            ),
+        }
@@ -0,0 +1,312 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from lxml import etree
+from gvm.connections import UnixSocketConnection
+from gvm.errors import GvmError, GvmResponseError
+from gvm.protocols.core import Request
+from gvm.protocols.gmp import Gmp
+from gvm.protocols.gmp.requests.v224 import Authentication, Version
+from gvm.transforms import EtreeCheckCommandTransform, check_command_status
+from config import Config
+from libraries import GVMLogger
+from libraries.metrics import GMP_DURATION, GMP_ERRORS
+
+
+class GVMPooledSession:
+    def __init__(self, socket_path: str, timeout: float):
+        connection = UnixSocketConnection(path=socket_path, timeout=timeout)
+        # Gmp picks the protocol version supported by gvmd while connecting
+        self.gmp = Gmp(
+            connection=connection, transform=EtreeCheckCommandTransform()
+        ).__enter__()
+        self.authenticated_at = 0.0
+        self.last_used = time.monotonic()
+
+    def authenticate(self, username: str, password: str):
+        self.gmp.authenticate(username, password)
+        self.authenticated_at = time.monotonic()
+
+    def close(self):
+        try:
+            self.gmp.disconnect()
+        except Exception:
+            pass
+
+
+class GVMConnectionPool:
+    def __init__(
+        self,
+        logger: GVMLogger,
+        socket_path: str | None = None,
+        username: str | None = None,
+        password: str | None = None,
+        size: int | None = None,
+        timeout: float | None = None,
+        health_check_interval: float | None = None,
+        session_lifetime: float | None = None,
+    ):
+        self.socket_path = socket_path or Config.GMP_SOCKET_PATH
+        self.username = username or Config.USERNAME
+        self.password = password or Config.PASSWORD
+        self.size = size if size is not None else Config.GMP_POOL_SIZE
+        self.timeout = timeout if timeout is not None else Config.GMP_TIMEOUT
+        self.health_check_interval = (
+            health_check_interval
+            if health_check_interval is not None
+            else Config.GMP_HEALTH_CHECK_INTERVAL
+        )
+        self.session_lifetime = (
+            session_lifetime
+            if session_lifetime is not None
+            else Config.GMP_SESSION_LIFETIME
+        )
+        self.__write_log: function = logger.write_log
+
+        self.__slots = threading.BoundedSemaphore(self.size)
+        self.__idle: queue.LifoQueue[GVMPooledSession] = queue.LifoQueue()
+        self.__pid = os.getpid()
+
+    def __new_session(self) -> GVMPooledSession:
+        session = GVMPooledSession(self.socket_path, self.timeout)
+        try:
+            session.authenticate(self.username, self.password)
+        except Exception:
+            session.close()
+            raise
+        self.__write_log(f"Opened GMP connection to {self.socket_path}", GVMLogger.INFO)
+        return session
+
+    def __check(self, session: GVMPooledSession) -> bool:
+        now = time.monotonic()
+        try:
+            if now - session.authenticated_at >= self.session_lifetime:
+                session.authenticate(self.username, self.password)
+            elif now - session.last_used >= self.health_check_interval:
+                session.gmp.get_version()
+                if not session.gmp.is_authenticated():
+                    session.authenticate(self.username, self.password)
+        except (GvmError, OSError) as e:
+            self.__write_log(
+                f"Dropping unhealthy GMP connection: {e}", GVMLogger.WARNING
+            )
+            session.close()
+            return False
+        return True
+
+    def __acquire(self) -> GVMPooledSession:
+        if self.__pid != os.getpid():
+            # Connections inherited from a parent process are not ours to reuse
+            self.__idle = queue.LifoQueue()
+            self.__pid = os.getpid()
+
+        while True:
+            try:
+                session = self.__idle.get_nowait()
+            except queue.Empty:
+                return self.__new_session()
+            if self.__check(session):
+                return session
+
+    @contextmanager
+    def session(self, command: str = "gmp"):
+        if not self.__slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No GMP connection available after {self.timeout}s")
+        try:
+            session = self.__acquire()
+            started = time.perf_counter()
+            try:
+                yield session.gmp
+            except GvmResponseError:
+                # gvmd answered, so the connection itself is still usable
+                GMP_ERRORS.inc(command=command)
+                self.__release(session)
+                raise
+            except (GvmError, OSError):
+                GMP_ERRORS.inc(command=command)
+                session.close()
+                raise
+            except BaseException:
+                self.__release(session)
+                raise
+            else:
+                self.__release(session)
+            finally:
+                GMP_DURATION.observe(time.perf_counter() - started, command=command)
+        finally:
+            self.__slots.release()
+
+    def __release(self, session: GVMPooledSession):
+        session.last_used = time.monotonic()
+        self.__idle.put(session)
+
+    def close(self):
+        while True:
+            try:
+                self.__idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class GVMAsyncSession:
+    READ_SIZE = 256 * 1024
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timeout: float
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.authenticated_at = 0.0
+        self.last_used = time.monotonic()
+        # Set while a response is outstanding, such a connection can not be reused
+        self.busy = False
+
+    @classmethod
+    async def open(cls, socket_path: str, timeout: float) -> "GVMAsyncSession":
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(socket_path), timeout
+        )
+        return cls(reader, writer, timeout)
+
+    async def send(self, request: Request) -> etree._Element:
+        data = bytes(request)
+        # gvmd answers every command with a single <command_response> element
+        tag = f"{etree.fromstring(data).tag}_response"
+        parser = etree.XMLPullParser(events=("end",), tag=tag, huge_tree=True)
+
+        self.busy = True
+        self.writer.write(data)
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+        while True:
+            chunk = await asyncio.wait_for(
+                self.reader.read(self.READ_SIZE), self.timeout
+            )
+            if not chunk:
+                raise GvmError("Remote closed the connection")
+            # Large pages are parsed as they arrive, never in one blocking step
+            parser.feed(chunk)
+            if list(parser.read_events()):
+                break
+        self.busy = False
+
+        response = parser.close()
+        check_command_status(response)
+        return response
+
+    async def authenticate(self, username: str, password: str):
+        await self.send(Authentication.authenticate(username, password))
+        self.authenticated_at = time.monotonic()
+
+    def close(self):
+        self.writer.close()
+
+
+class GVMAsyncConnectionPool:
+    # The same pool for the asyncio engine, its connections only live on one event loop
+    def __init__(
+        self,
+        logger: GVMLogger,
+        socket_path: str | None = None,
+        username: str | None = None,
+        password: str | None = None,
+        size: int | None = None,
+        timeout: float | None = None,
+        health_check_interval: float | None = None,
+        session_lifetime: float | None = None,
+    ):
+        self.socket_path = socket_path or Config.GMP_SOCKET_PATH
+        self.username = username or Config.USERNAME
+        self.password = password or Config.PASSWORD
+        self.size = size if size is not None else Config.GMP_POOL_SIZE
+        self.timeout = timeout if timeout is not None else Config.GMP_TIMEOUT
+        self.health_check_interval = (
+            health_check_interval
+            if health_check_interval is not None
+            else Config.GMP_HEALTH_CHECK_INTERVAL
+        )
+        self.session_lifetime = (
+            session_lifetime
+            if session_lifetime is not None
+            else Config.GMP_SESSION_LIFETIME
+        )
+        self.__write_log: function = logger.write_log
+
+        self.__slots = asyncio.BoundedSemaphore(self.size)
+        self.__idle: list[GVMAsyncSession] = []
+
+    async def __new_session(self) -> GVMAsyncSession:
+        session = await GVMAsyncSession.open(self.socket_path, self.timeout)
+        try:
+            await session.authenticate(self.username, self.password)
+        except BaseException:
+            session.close()
+            raise
+        self.__write_log(f"Opened GMP connection to {self.socket_path}", GVMLogger.INFO)
+        return session
+
+    async def __check(self, session: GVMAsyncSession) -> bool:
+        now = time.monotonic()
+        try:
+            if now - session.authenticated_at >= self.session_lifetime:
+                await session.authenticate(self.username, self.password)
+            elif now - session.last_used >= self.health_check_interval:
+                await session.send(Version.get_version())
+        except (GvmError, OSError) as e:
+            self.__write_log(
+                f"Dropping unhealthy GMP connection: {e}", GVMLogger.WARNING
+            )
+            session.close()
+            return False
+        return True
+
+    async def __acquire(self) -> GVMAsyncSession:
+        while self.__idle:
+            session = self.__idle.pop()
+            if await self.__check(session):
+                return session
+        return await self.__new_session()
+
+    @asynccontextmanager
+    async def session(self, command: str = "gmp"):
+        try:
+            await asyncio.wait_for(self.__slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No GMP connection available after {self.timeout}s")
+        try:
+            session = await self.__acquire()
+            started = time.perf_counter()
+            try:
+                yield session
+            except GvmResponseError:
+                GMP_ERRORS.inc(command=command)
+                self.__release(session)
+                raise
+            except (GvmError, OSError):
+                GMP_ERRORS.inc(command=command)
+                session.close()
+                raise
+            except BaseException:
+                self.__release(session)
+                raise
+            else:
+                self.__release(session)
+            finally:
+                GMP_DURATION.observe(time.perf_counter() - started, command=command)
+        finally:
+            self.__slots.release()
+
+    def __release(self, session: GVMAsyncSession):
+        if session.busy:
+            # Cancelled while waiting for a response, the rest of it is still on the way
+            session.close()
+            return
+        session.last_used = time.monotonic()
+        self.__idle.append(session)
+
+    def close(self):
+        while self.__idle:
+            self.__idle.pop().close()
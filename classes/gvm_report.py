@@ -1,28 +1,195 @@
-import pandas as pd
+import fcntl
+import io
 import json
+import os
+import numpy as np
+import pandas as pd
+import shutil
 import subprocess
-from libraries import GVMLogger
-from datetime import datetime
-from libraries.common import convert_floats_to_ints
+import tempfile
+import time
+from base64 import b64decode
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import IO, Iterable, Iterator
+from lxml import etree
+from libraries import GVMJobCancelled, GVMLogger, GVMShipStats, GVMSyslogWriter
+from libraries.logs import CORRELATION_ENV
+from libraries.common import convert_floats_to_ints, is_uuid, normalize_column
+from libraries.metrics import SUBPROCESS_FAILURES
+from libraries.gmp_results import (
+    CSV_COLUMNS,
+    CSV_NUMERIC_COLUMNS,
+    iter_report_rows,
+    iter_result_rows,
+)
 from config import Config
+from classes.gvm_index import GVMShipIndex
+from classes.gvm_pool import GVMConnectionPool
 
 
 class GVMReport:
+    REFERENCE_COLUMNS = ["CERTs", "CVEs", "BIDs"]
+    BLANK_COLUMNS = [
+        "Hostname",
+        "Impact",
+        "Affected Software/OS",
+        "Product Detection Result",
+        "Vulnerability Insight",
+        "Port Protocol",
+    ]
+    ENGINES = ["vectorized", "legacy"]
+    INGESTS = ["csv", "xml"]
+    CSV_REPORT_FORMAT_ID = "c1645568-627a-11e3-a660-406186ea4fc5"
+
     def __init__(
         self,
         openvas_addr: str = "127.0.0.1",
         host_name: str = "root",
         program_name: str = "openvas",
+        engine: str | None = None,
+        ingest: str | None = None,
+        pool: GVMConnectionPool | None = None,
+        process_pool: ProcessPoolExecutor | None = None,
+        stats: GVMShipStats | None = None,
     ):
         self.server_addr = openvas_addr
         self.host_name = host_name
         self.program_name = program_name
+        self.engine = engine or Config.REPORT_ENGINE
+        self.ingest = ingest or Config.REPORT_INGEST
+        self.pool = pool
+        self.process_pool = process_pool
+        self.stats = stats or GVMShipStats()
+
+        if self.engine not in self.ENGINES:
+            raise ValueError(f"Unknown report engine: {self.engine}")
+        if self.ingest not in self.INGESTS:
+            raise ValueError(f"Unknown report ingest: {self.ingest}")
+
+        self.logger = GVMLogger.get(__name__, Config.REPORT_LOG_FILE)
+        self.__write_log = self.logger.write_log
+        self.__span = self.logger.span
+        self.ship_index = (
+            GVMShipIndex(Config.SHIP_INDEX_FILE, self.logger)
+            if Config.SHIP_INDEX_ENABLED
+            else None
+        )
+
+    def process_data(
+        self, input_file: str | IO, chunk_size: int | None = None
+    ) -> list | Iterator[dict]:
+        if chunk_size:
+            return self.__stream_data(input_file, chunk_size)
+
+        self.__write_log(f"Processing data ({self.engine} engine)", GVMLogger.INFO)
+        with self.stats.stage("ingest"):
+            data = pd.read_csv(input_file, dtype=self.__read_dtypes())
+        final_data = self.__process_frame(data)
+
+        self.__write_log("Processing data completed", GVMLogger.INFO)
+        return final_data
+
+    def __stream_data(self, input_file: str | IO, chunk_size: int) -> Iterator[dict]:
+        self.__write_log(
+            f"Streaming data in chunks of {chunk_size} rows ({self.engine} engine)",
+            GVMLogger.INFO,
+        )
+        with pd.read_csv(
+            input_file, dtype=self.__read_dtypes(), chunksize=chunk_size
+        ) as reader:
+            for records in self.__process_frames(reader):
+                yield from records
+
+        self.__write_log("Streaming data completed", GVMLogger.INFO)
+
+    def process_rows(
+        self, rows: Iterable[dict], chunk_size: int | None = None
+    ) -> list | Iterator[dict]:
+        if chunk_size:
+            return self.__stream_rows(rows, chunk_size)
+
+        self.__write_log(f"Processing rows ({self.engine} engine)", GVMLogger.INFO)
+        with self.stats.stage("ingest"):
+            data = pd.DataFrame.from_records(list(rows), columns=CSV_COLUMNS)
+        final_data = self.__process_frame(data)
+
+        self.__write_log("Processing rows completed", GVMLogger.INFO)
+        return final_data
+
+    def __stream_rows(self, rows: Iterable[dict], chunk_size: int) -> Iterator[dict]:
+        self.__write_log(
+            f"Streaming rows in chunks of {chunk_size} ({self.engine} engine)",
+            GVMLogger.INFO,
+        )
+        for records in self.__process_frames(self.__row_frames(rows, chunk_size)):
+            yield from records
+
+        self.__write_log("Streaming rows completed", GVMLogger.INFO)
+
+    @staticmethod
+    def __row_frames(rows: Iterable[dict], chunk_size: int) -> Iterator[pd.DataFrame]:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame.from_records(chunk, columns=CSV_COLUMNS)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame.from_records(chunk, columns=CSV_COLUMNS)
 
-        self.__write_log = GVMLogger(__name__, Config.REPORT_LOG_FILE).write_log
+    @staticmethod
+    def __read_dtypes() -> dict:
+        # Inferred types would depend on which rows share a chunk or page, a text column
+        # whose values in one chunk all look numeric would come out as numbers
+        return {
+            name: "float64" if name in CSV_NUMERIC_COLUMNS else str
+            for name in CSV_COLUMNS
+        }
 
-    def process_data(self, input_file: str) -> list:
-        self.__write_log("Processing data", GVMLogger.INFO)
-        data = pd.read_csv(input_file)
+    def __process_frame(self, data: pd.DataFrame) -> list:
+        self.stats.rows_in += len(data)
+        with self.stats.stage("process"):
+            if self.process_pool is not None:
+                return self.process_pool.submit(
+                    self.process_frame, data, self.engine
+                ).result()
+            return self.process_frame(data, self.engine)
+
+    def __process_frames(self, frames: Iterable[pd.DataFrame]) -> Iterator[list]:
+        # Reading or parsing the next chunk is ingest time, turning it into records is processing
+        frames = self.stats.timed(frames, "ingest")
+        if self.process_pool is None:
+            for frame in frames:
+                yield self.__process_frame(frame)
+            return
+
+        # Chunks are processed ahead in worker processes but handed on in order
+        read_ahead = max(1, Config.HOOKS_PROCESS_WORKERS)
+        pending = deque()
+        for frame in frames:
+            self.stats.rows_in += len(frame)
+            pending.append(
+                self.process_pool.submit(self.process_frame, frame, self.engine)
+            )
+            if len(pending) >= read_ahead:
+                with self.stats.stage("process"):
+                    records = pending.popleft().result()
+                yield records
+        while pending:
+            with self.stats.stage("process"):
+                records = pending.popleft().result()
+            yield records
+
+    @classmethod
+    def process_frame(cls, data: pd.DataFrame, engine: str) -> list:
+        # A classmethod so worker processes can run it without the report instance
+        if engine == "legacy":
+            return cls.__process_frame_legacy(data)
+        return cls.__process_frame_vectorized(data)
+
+    @classmethod
+    def __process_frame_legacy(cls, data: pd.DataFrame) -> list:
         final_data = []
 
         for index, row in data.iterrows():
@@ -102,25 +269,104 @@ class GVMReport:
                 temp_json["BIDs"] = bid
                 final_data.append(temp_json)
 
-        self.__write_log("Processing data completed", GVMLogger.INFO)
         return final_data
 
+    @classmethod
+    def __process_frame_vectorized(cls, data: pd.DataFrame) -> list:
+        columns = {name: normalize_column(data[name]) for name in data.columns}
+
+        # Missing columns are appended in the same order the legacy engine adds them
+        for name in ["CERTs", "Other References", "BIDs", "CVEs"] + cls.BLANK_COLUMNS:
+            if name not in columns:
+                columns[name] = np.full(len(data), None, dtype=object)
+
+        for name in cls.BLANK_COLUMNS:
+            values = columns[name]
+            values[pd.isna(values)] = ""
+
+        references = pd.Series(columns["Other References"], dtype=object)
+        missing = references.isna().to_numpy()
+        references = references.str.split(",").to_numpy(dtype=object, copy=True)
+        for position in np.flatnonzero(missing):
+            references[position] = []
+        columns["Other References"] = references
+
+        # Split-then-explode every reference column, then interleave the exploded
+        # parts back into row order with CERTs before CVEs before BIDs
+        positions = []
+        fanned = []
+        for name in cls.REFERENCE_COLUMNS:
+            exploded = (
+                pd.Series(columns[name], dtype=object)
+                .fillna("")
+                .str.split(",")
+                .explode()
+            )
+            positions.append(exploded.index.to_numpy())
+            fanned.append(exploded.to_numpy(dtype=object))
+
+        order = np.argsort(np.concatenate(positions), kind="stable")
+        rows = np.concatenate(positions)[order]
+        for index, name in enumerate(cls.REFERENCE_COLUMNS):
+            parts = [
+                part if part_index == index else np.full(len(part), "", dtype=object)
+                for part_index, part in enumerate(fanned)
+            ]
+            columns[name] = np.concatenate(parts)[order]
+
+        names = list(columns)
+        values = [
+            (
+                columns[name] if name in cls.REFERENCE_COLUMNS else columns[name][rows]
+            ).tolist()
+            for name in names
+        ]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
     def output_data(
-        self, processed_data: list, output_file: str = "./output", mode: str = "w"
+        self,
+        processed_data: Iterable[dict],
+        output_file: str = "./output",
+        mode: str = "w",
     ) -> list:
-        self.__write_log("Outputting data", GVMLogger.INFO)
-        with open(output_file, mode) as f:
-            for entry in processed_data:
-                current_time = datetime.now().strftime("%b %d %H:%M:%S")
-                prefix = f"{current_time} {self.host_name} {self.program_name}: "
-                json_line = json.dumps(entry)
-                f.write(f"{prefix}{json_line}\n")
-        self.__write_log("Outputting data completed", GVMLogger.INFO)
-
-    def ingest_data(self, output_file) -> str:
-        self.__write_log("Ingesting data", GVMLogger.INFO)
-        command = [
+        self.tee_data(processed_data, [(output_file, mode)])
+
+    def tee_data(self, processed_data: Iterable[dict], outputs: list[tuple[str, str]]):
+        self.__write_log(
+            f"Outputting data to {', '.join(path for path, _ in outputs)}",
+            GVMLogger.INFO,
+        )
+        with self.stats.stage("output"), self.__span("output"), GVMSyslogWriter(
+            self.host_name, self.program_name
+        ) as writer:
+            for output_file, mode in outputs:
+                writer.add_sink(output_file, mode)
+            writer.write_all(processed_data)
+        self.stats.rows_out += writer.lines_written
+        self.stats.bytes_written += writer.bytes_written
+        self.__write_log(
+            f"Outputting data completed ({writer.lines_written} lines, {writer.bytes_written} bytes per output)",
+            GVMLogger.INFO,
+        )
+
+    def publish_output(self, output_file: str):
+        # OUTPUT_PATH only gets complete job outputs, a job failing halfway leaves nothing
+        # behind that its retry would append again
+        with self.stats.stage("output"), self.__span("publish"), open(
+            output_file, "rb"
+        ) as source, open(Config.OUTPUT_PATH, "ab") as target:
+            # Jobs of other reports may append at the same time
+            fcntl.flock(target, fcntl.LOCK_EX)
+            shutil.copyfileobj(source, target, Config.OUTPUT_BUFFER_SIZE)
+        self.__write_log(
+            f"Appended {output_file} to {Config.OUTPUT_PATH}", GVMLogger.INFO
+        )
+
+    def gvm_script_command(self, script: str, *args: str) -> list:
+        # sudo resets the environment, the correlation ID has to be kept explicitly
+        return [
             "sudo",
+            f"--preserve-env={CORRELATION_ENV}",
             "-u",
             Config.ALT_USER,
             "gvm-script",
@@ -129,25 +375,308 @@ class GVMReport:
             "--gmp-password",
             Config.PASSWORD,
             "socket",
-            f"{Config.SCRIPTS_PATH}/export-csv-report-latest.gmp.py",
-            output_file,
+            "--socketpath",
+            Config.GMP_SOCKET_PATH,
+            f"{Config.SCRIPTS_PATH}/{script}",
+            *args,
         ]
-        result = subprocess.run(
-            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+
+    def log_script_output(self, script: str, stderr: str):
+        # The scripts report their own timings, logged here under the same correlation ID
+        for line in stderr.splitlines():
+            if line.strip():
+                self.__write_log(f"{script}: {line.strip()}", GVMLogger.DEBUG)
+
+    def export_csv_command(
+        self, output_file: str, report_id: str | None, task: str | None
+    ) -> tuple[str, list]:
+        page_size = str(Config.GMP_PAGE_SIZE)
+        if report_id:
+            script = "export-csv-report.gmp.py"
+            args = [report_id, output_file, page_size]
+        else:
+            script = "export-csv-report-latest.gmp.py"
+            args = [output_file, page_size, *([task] if task else [])]
+        return script, self.gvm_script_command(script, *args)
+
+    def export_xml_command(self, report_id: str | None, task: str | None) -> list:
+        return self.gvm_script_command(
+            "export-xml-results.gmp.py",
+            *([report_id] if report_id else []),
+            *(["++task", task] if task and not report_id else []),
+            "++page-size",
+            str(Config.GMP_PAGE_SIZE),
         )
+
+    def ingest_data(
+        self, output_file, report_id: str | None = None, task: str | None = None
+    ) -> str:
+        self.__write_log("Ingesting data", GVMLogger.INFO)
+        script, command = self.export_csv_command(output_file, report_id, task)
+        with self.stats.stage("ingest"), self.__span(f"ingest {script}"):
+            result = subprocess.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                env=GVMLogger.correlation_env(),
+            )
+        self.log_script_output(script, result.stderr)
+        if result.returncode != 0:
+            SUBPROCESS_FAILURES.inc(script=script)
+            raise RuntimeError(
+                f"{script} failed with exit code {result.returncode}: "
+                f"{result.stderr.strip()}"
+            )
         self.__write_log("Ingesting data completed", GVMLogger.INFO)
 
         return f"{output_file}.csv"
 
-    def ship_data(self, output_file: str):
+    def ingest_results(
+        self, report_id: str | None = None, task: str | None = None
+    ) -> Iterator[dict]:
+        self.__write_log("Ingesting results as XML", GVMLogger.INFO)
+        command = self.export_xml_command(report_id, task)
+
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                env=GVMLogger.correlation_env(),
+            )
+            try:
+                yield from iter_result_rows(process.stdout)
+                process.stdout.close()
+                returncode = process.wait()
+                stderr.seek(0)
+                output = stderr.read().decode(errors="replace")
+                self.log_script_output("export-xml-results.gmp.py", output)
+                if returncode != 0:
+                    SUBPROCESS_FAILURES.inc(script="export-xml-results.gmp.py")
+                    raise RuntimeError(
+                        f"export-xml-results.gmp.py failed with exit code {returncode}: "
+                        f"{output.strip()}"
+                    )
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+
+        self.__write_log("Ingesting results completed", GVMLogger.INFO)
+
+    def get_latest_report_id(self) -> str:
+        with self.pool.session("get_reports") as gmp:
+            response = gmp.get_reports(
+                details=False,
+                filter_string="status=Done sort-reverse=modified first=1 rows=1",
+            )
+
+        reports = response.xpath("report")
+        if not reports:
+            raise RuntimeError("No finished report found")
+        return reports[0].get("id")
+
+    @staticmethod
+    def task_filter(task: str) -> str:
+        # Alerts only know the task name, so a task is matched by ID or exact name
+        if is_uuid(task):
+            return f"uuid={task} rows=1"
+        return f'name="{task}" rows=1'
+
+    def get_task_report_id(self, task: str) -> str:
+        with self.pool.session("get_tasks") as gmp:
+            response = gmp.get_tasks(
+                details=False, filter_string=self.task_filter(task)
+            )
+
+        tasks = response.xpath("task")
+        if not tasks:
+            raise RuntimeError(f"Task {task} not found")
+        report = tasks[0].find("last_report/report")
+        if report is None:
+            raise RuntimeError(f"Task {task} has no finished report")
+        return report.get("id")
+
+    def count_results(self, report_id: str) -> int | None:
+        with self.pool.session("get_report") as gmp:
+            response = gmp.get_report(report_id=report_id, details=False)
+        count = response.findtext("report/report/result_count/filtered")
+        return int(count) if count else None
+
+    def __fetch_page(
+        self, report_id: str, filter_string: str | None, **kwargs
+    ) -> etree._Element:
+        with self.pool.session("get_report") as gmp:
+            return gmp.get_report(
+                report_id=report_id,
+                filter_string=filter_string,
+                ignore_pagination=filter_string is None,
+                details=True,
+                **kwargs,
+            )
+
+    def fetch_pages(self, report_id: str, **kwargs) -> Iterator[etree._Element]:
+        page_size = Config.GMP_PAGE_SIZE
+        total = self.count_results(report_id) if page_size > 0 else None
+        if total is None:
+            yield self.__fetch_page(report_id, None, **kwargs)
+            return
+
+        # A report without results still has one (empty) page
+        filters = [
+            f"first={first} rows={page_size}"
+            for first in range(1, max(total, 1) + 1, page_size)
+        ]
+        parallelism = max(1, Config.GMP_PAGE_PARALLELISM)
+        self.__write_log(
+            f"Fetching {total} results of report {report_id} in {len(filters)} pages "
+            f"of {page_size} ({parallelism} in parallel)",
+            GVMLogger.INFO,
+        )
+
+        if parallelism == 1:
+            for filter_string in filters:
+                yield self.__fetch_page(report_id, filter_string, **kwargs)
+            return
+
+        # Pages are fetched ahead over separate connections but handed on in order
+        with ThreadPoolExecutor(parallelism) as executor:
+            pending = deque()
+            for filter_string in filters:
+                pending.append(
+                    executor.submit(
+                        self.__fetch_page, report_id, filter_string, **kwargs
+                    )
+                )
+                if len(pending) >= parallelism:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def fetch_data(self, report_id: str) -> Iterator[IO]:
+        self.__write_log(f"Fetching CSV report {report_id}", GVMLogger.INFO)
+        for response in self.fetch_pages(
+            report_id, report_format_id=self.CSV_REPORT_FORMAT_ID
+        ):
+            content = response.find("report").find("report_format").tail
+            if content:
+                yield io.BytesIO(b64decode(content))
+        self.__write_log("Fetching CSV report completed", GVMLogger.INFO)
+
+    def fetch_results(self, report_id: str) -> Iterator[dict]:
+        self.__write_log(f"Fetching results of report {report_id}", GVMLogger.INFO)
+        for response in self.fetch_pages(report_id):
+            yield from iter_report_rows(response.find("report"))
+        self.__write_log("Fetching results completed", GVMLogger.INFO)
+
+    def ingest_records(
+        self,
+        report_id: str | None = None,
+        task: str | None = None,
+        temp_file: str = f"{Config.CACHE_PATH}/temp",
+    ) -> list | Iterator[dict]:
+        chunk_size = Config.REPORT_CHUNK_SIZE
+
+        if self.pool is not None:
+            if not report_id:
+                with self.stats.stage("ingest"), self.__span("resolve report"):
+                    report_id = (
+                        self.get_task_report_id(task)
+                        if task
+                        else self.get_latest_report_id()
+                    )
+            self.stats.report_id = report_id
+            if self.ingest == "xml":
+                return self.process_rows(self.fetch_results(report_id), chunk_size)
+            return (
+                record
+                for page in self.stats.timed(self.fetch_data(report_id), "ingest")
+                for record in self.process_data(page, chunk_size)
+            )
+
+        if self.ingest == "xml":
+            return self.process_rows(self.ingest_results(report_id, task), chunk_size)
+        csv_file = self.ingest_data(temp_file, report_id, task)
+        return self.process_data(csv_file, chunk_size)
+
+    def benchmark_ingest(self, report_id: str) -> dict:
+        benchmark = {}
+        lines = {}
+        for ingest in self.INGESTS:
+            started = time.perf_counter()
+            if ingest == "xml":
+                records = self.process_rows(self.ingest_results(report_id))
+            else:
+                temp_file = self.ingest_data(
+                    f"{Config.CACHE_PATH}/benchmark", report_id
+                )
+                records = self.process_data(temp_file)
+                os.remove(temp_file)
+            elapsed = time.perf_counter() - started
+
+            lines[ingest] = sorted(json.dumps(record) for record in records)
+            benchmark[ingest] = {
+                "seconds": round(elapsed, 3),
+                "records": len(records),
+                "records_per_second": round(len(records) / elapsed) if elapsed else 0,
+            }
+
+        benchmark["identical"] = lines["csv"] == lines["xml"]
+        self.__write_log(
+            f"Ingest benchmark for {report_id}: {benchmark}", GVMLogger.INFO
+        )
+        return benchmark
+
+    def ship_data(
+        self,
+        output_file: str,
+        force: bool = False,
+        report_id: str | None = None,
+        task: str | None = None,
+    ):
         try:
-            self.__write_log("Shipping data", GVMLogger.INFO)
-            temp_file = f"{Config.CACHE_PATH}/temp"
-            temp_file = self.ingest_data(temp_file)
-            list = self.process_data(temp_file)
-            self.output_data(list, output_file)
-            self.output_data(list, Config.OUTPUT_PATH, mode="a")
-            self.__write_log("Shipping data completed", GVMLogger.INFO)
+            with self.__span("ship"):
+                self.__ship_data(output_file, force, report_id, task)
+            self.__write_log(
+                f"Shipping data completed (stages {self.stats.to_dict()['stages']})",
+                GVMLogger.INFO,
+            )
 
+        except GVMJobCancelled:
+            self.__write_log("Shipping data cancelled", GVMLogger.WARN)
+            raise
         except Exception as e:
-            self.__write_log(e.with_traceback, GVMLogger.ERROR)
+            # Logged here and raised for the job queue, which decides about retries
+            self.__write_log(f"Shipping data failed: {e}", GVMLogger.ERROR)
+            raise
+
+    def __ship_data(
+        self,
+        output_file: str,
+        force: bool,
+        report_id: str | None,
+        task: str | None,
+    ):
+        if report_id:
+            self.__write_log(f"Shipping data of report {report_id}", GVMLogger.INFO)
+        elif task:
+            self.__write_log(f"Shipping data of task {task}", GVMLogger.INFO)
+        else:
+            self.__write_log("Shipping data", GVMLogger.INFO)
+        self.stats.report_id = report_id
+        records = self.ingest_records(report_id, task, f"{output_file}-ingest")
+        # The job output is staged in output_file and appended to OUTPUT_PATH once complete
+        outputs = [(output_file, "w")]
+
+        if self.ship_index is None:
+            self.tee_data(records, outputs)
+            self.publish_output(output_file)
+        else:
+            if force:
+                self.__write_log("Forcing a full reship", GVMLogger.INFO)
+            with self.ship_index.transaction(self.stats.report_id):
+                self.tee_data(self.ship_index.filter(records, force), outputs)
+                self.publish_output(output_file)
+            self.stats.rows_skipped += self.ship_index.skipped
+            self.ship_index.maintain()
@@ -0,0 +1,369 @@
+import asyncio
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Awaitable, Callable
+from config import Config
+from libraries import GVMJobCancelled, GVMLogger, GVMShipStats
+from libraries.metrics import (
+    JOB_DURATION,
+    JOB_RUNS,
+    METRICS,
+    OUTPUT_BYTES,
+    ROWS_EMITTED,
+    ROWS_INGESTED,
+    ROWS_SKIPPED,
+    STAGE_DURATION,
+)
+from classes.gvm_jobs import GVMJobStore, GVMShipJob
+
+
+class GVMWorkerPool:
+    # Seconds between saves of the stats of running jobs
+    STATS_INTERVAL = 5
+
+    def __init__(
+        self,
+        logger: GVMLogger,
+        store: GVMJobStore,
+        workers: int | None = None,
+        process_workers: int | None = None,
+        poll_interval: float | None = None,
+    ):
+        self.store = store
+        self.workers = workers if workers is not None else Config.HOOKS_WORKERS
+        self.process_workers = (
+            process_workers
+            if process_workers is not None
+            else Config.HOOKS_PROCESS_WORKERS
+        )
+        self.poll_interval = (
+            poll_interval if poll_interval is not None else Config.HOOKS_POLL_INTERVAL
+        )
+        self.owner: str | None = None
+        self.__write_log: function = logger.write_log
+        self.__span = logger.span
+
+        self.__wake = threading.Event()
+        self.__stopping = threading.Event()
+        self.__threads: list[threading.Thread] = []
+        # The heartbeat keeps the leases of draining jobs alive, it stops after them
+        self.__heartbeat_stopping = threading.Event()
+        self.__heartbeat_thread: threading.Thread | None = None
+        # Set once a drain timed out, the jobs still running were handed back already
+        self.__released = False
+        # Cancel flags of the jobs running in this process, checked at chunks and stages
+        self.__cancel_events: dict[str, threading.Event] = {}
+        # Stats of the jobs running in this process, saved with every heartbeat
+        self.__stats: dict[str, GVMShipStats] = {}
+        # The process pool only starts its processes on first use
+        self.process_pool = (
+            ProcessPoolExecutor(
+                self.process_workers,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+            if self.process_workers > 0
+            else None
+        )
+
+    def start(self, handler: Callable[[GVMShipJob, GVMShipStats], None]):
+        if self.__threads:
+            return
+
+        # Claims are recorded as "host:pid" so other processes can tell ours apart
+        host = socket.gethostname()
+        self.owner = f"{host}:{os.getpid()}"
+        self.store.resume_orphans(host)
+
+        self.__threads = self._threads(handler)
+        self.__heartbeat_thread = threading.Thread(
+            target=self.__heartbeat, name="gvm-ship-heartbeat", daemon=True
+        )
+        for thread in [*self.__threads, self.__heartbeat_thread]:
+            thread.start()
+        self.__write_log(
+            f"Started {self.workers} shipping workers as {self.owner}", GVMLogger.INFO
+        )
+
+    def _threads(self, handler: Callable) -> list[threading.Thread]:
+        return [
+            threading.Thread(
+                target=self.__work,
+                args=[handler],
+                name=f"gvm-ship_{index}",
+                daemon=True,
+            )
+            for index in range(self.workers)
+        ]
+
+    def wake(self):
+        self.__wake.set()
+
+    def cancel(self, job_id: str) -> bool:
+        event = self.__cancel_events.get(job_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+    def __work(self, handler: Callable[[GVMShipJob, GVMShipStats], None]):
+        while not self.__stopping.is_set():
+            try:
+                job = self.store.claim(self.owner)
+            except Exception as e:
+                self.__write_log(f"Claiming a job failed: {e}", GVMLogger.ERROR)
+                job = None
+
+            if job is None:
+                # New jobs of this process wake a worker, the poll picks up everyone else's
+                self.__wake.wait(self.poll_interval)
+                self.__wake.clear()
+                continue
+
+            # Jobs log under the ID of the request that queued them
+            with GVMLogger.correlate(job.correlation_id):
+                self.__run(job, handler)
+
+    def __run(
+        self, job: GVMShipJob, handler: Callable[[GVMShipJob, GVMShipStats], None]
+    ):
+        stats = self._begin(job)
+        started = time.perf_counter()
+        error = None
+        try:
+            with self.__span(f"job {job.id}"):
+                handler(job, stats)
+        except Exception as e:
+            error = e
+        self._finish(job, stats, error, time.perf_counter() - started)
+
+    def _begin(self, job: GVMShipJob) -> GVMShipStats:
+        self.__write_log(
+            f"Running job {job.id} ({job.key}, attempt {job.attempts})",
+            GVMLogger.INFO,
+        )
+        cancelled = self.__cancel_events[job.id] = threading.Event()
+        stats = self.__stats[job.id] = GVMShipStats(cancelled)
+        return stats
+
+    def _finish(
+        self,
+        job: GVMShipJob,
+        stats: GVMShipStats,
+        error: Exception | None,
+        duration: float,
+    ):
+        result = "done"
+        try:
+            if self.__released:
+                result = "released"
+            elif isinstance(error, GVMJobCancelled):
+                result = "cancelled"
+                self.store.cancelled(job, stats.to_dict())
+            elif error is not None:
+                result = "failed"
+                self.store.fail(
+                    job, f"{type(error).__name__}: {error}", stats.to_dict()
+                )
+            else:
+                self.store.complete(job, stats.to_dict())
+                self.__write_log(
+                    f"Job {job.id} completed ({stats.rows_in} rows in, "
+                    f"{stats.rows_out} out, stages {stats.to_dict()['stages']})",
+                    GVMLogger.INFO,
+                )
+        finally:
+            del self.__cancel_events[job.id]
+            del self.__stats[job.id]
+            self.__observe(stats, result, duration)
+
+    @staticmethod
+    def __observe(stats: GVMShipStats, result: str, duration: float):
+        JOB_RUNS.inc(result=result)
+        JOB_DURATION.observe(duration)
+        for stage, seconds in stats.stages.items():
+            STAGE_DURATION.observe(seconds, stage=stage)
+        ROWS_INGESTED.inc(stats.rows_in)
+        ROWS_EMITTED.inc(stats.rows_out)
+        ROWS_SKIPPED.inc(stats.rows_skipped)
+        OUTPUT_BYTES.inc(stats.bytes_written)
+
+    def __heartbeat(self):
+        # Cancels are picked up every poll, the lease only needs renewing now and then
+        renewed = dumped = time.monotonic()
+        while not self.__heartbeat_stopping.wait(self.poll_interval):
+            try:
+                if self.__cancel_events:
+                    for job_id in self.store.cancel_requests(self.owner):
+                        self.cancel(job_id)
+                interval = self.store.lease / 4
+                if self.__stats:
+                    interval = min(interval, self.STATS_INTERVAL)
+                if time.monotonic() - renewed >= interval:
+                    self.store.heartbeat(
+                        self.owner,
+                        {
+                            job_id: stats.to_dict()
+                            for job_id, stats in list(self.__stats.items())
+                        },
+                    )
+                    renewed = time.monotonic()
+                if (
+                    Config.METRICS_ENABLED
+                    and time.monotonic() - dumped >= Config.METRICS_DUMP_INTERVAL
+                ):
+                    METRICS.dump(Config.METRICS_PATH)
+                    dumped = time.monotonic()
+            except Exception as e:
+                self.__write_log(f"Job heartbeat failed: {e}", GVMLogger.ERROR)
+
+        if Config.METRICS_ENABLED:
+            # Counters of stopped processes still count, so the last of them are kept
+            try:
+                METRICS.dump(Config.METRICS_PATH)
+            except OSError as e:
+                self.__write_log(f"Dumping metrics failed: {e}", GVMLogger.ERROR)
+
+    def shutdown(self, wait: bool = True, timeout: float | None = None) -> bool:
+        # Running jobs get until the timeout to finish, the rest go back to the queue
+        self.__stopping.set()
+        self.__wake.set()
+        drained = True
+        if wait:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            try:
+                for thread in self.__threads:
+                    thread.join(
+                        None
+                        if deadline is None
+                        else max(deadline - time.monotonic(), 0)
+                    )
+            except BaseException:
+                # gunicorn aborting the worker mid drain, the jobs go back right away
+                self.__release()
+                raise
+            drained = not any(thread.is_alive() for thread in self.__threads)
+            if not drained:
+                self.__release()
+        self.__heartbeat_stopping.set()
+        if wait and self.__heartbeat_thread is not None:
+            self.__heartbeat_thread.join()
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=wait and drained)
+        return drained
+
+    def __release(self):
+        self.__released = True
+        try:
+            self.store.release(self.owner)
+        except Exception as e:
+            # The lease runs out eventually and other workers resume the jobs then
+            self.__write_log(f"Releasing unfinished jobs failed: {e}", GVMLogger.ERROR)
+        for event in list(self.__cancel_events.values()):
+            event.set()
+
+
+class GVMAsyncWorkerPool(GVMWorkerPool):
+    # Jobs run as tasks of one event loop, the worker threads only process and write
+    def __init__(
+        self,
+        logger: GVMLogger,
+        store: GVMJobStore,
+        jobs: int | None = None,
+        **kwargs,
+    ):
+        super().__init__(logger, store, **kwargs)
+        self.jobs = jobs if jobs is not None else Config.HOOKS_ASYNC_JOBS
+        self.__write_log: function = logger.write_log
+        self.__span = logger.span
+
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="gvm-ship")
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.__wake = asyncio.Event()
+        self.__stopping = asyncio.Event()
+
+    def _threads(
+        self, handler: Callable[[GVMShipJob, GVMShipStats], Awaitable[None]]
+    ) -> list[threading.Thread]:
+        self.loop = asyncio.new_event_loop()
+        self.__write_log(
+            f"Shipping up to {self.jobs} jobs at once, processing on "
+            f"{self.workers} threads",
+            GVMLogger.INFO,
+        )
+        return [
+            threading.Thread(
+                target=self.__run_loop, args=[handler], name="gvm-ship", daemon=True
+            )
+        ]
+
+    def __run_loop(self, handler: Callable):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.__dispatch(handler))
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        finally:
+            self.loop.close()
+
+    def __signal(self, event: asyncio.Event):
+        try:
+            self.loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # The loop is already closed, there is nobody left to wake
+            pass
+
+    def wake(self):
+        if self.loop is not None:
+            self.__signal(self.__wake)
+
+    async def __dispatch(self, handler: Callable):
+        running: set[asyncio.Task] = set()
+        while not self.__stopping.is_set():
+            job = None
+            if len(running) < self.jobs:
+                try:
+                    job = await asyncio.to_thread(self.store.claim, self.owner)
+                except Exception as e:
+                    self.__write_log(f"Claiming a job failed: {e}", GVMLogger.ERROR)
+            if job is not None:
+                task = asyncio.create_task(self.__run(job, handler))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                continue
+
+            # Woken by new jobs of this process and finished jobs, the poll finds the rest
+            try:
+                await asyncio.wait_for(self.__wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.__wake.clear()
+
+        if running:
+            self.__write_log(f"Waiting for {len(running)} running jobs", GVMLogger.INFO)
+            await asyncio.wait(running)
+
+    async def __run(self, job: GVMShipJob, handler: Callable):
+        with GVMLogger.correlate(job.correlation_id):
+            stats = self._begin(job)
+            started = time.perf_counter()
+            error = None
+            try:
+                with self.__span(f"job {job.id}"):
+                    await handler(job, stats)
+            except Exception as e:
+                error = e
+            await asyncio.to_thread(
+                self._finish, job, stats, error, time.perf_counter() - started
+            )
+        self.__wake.set()
+
+    def shutdown(self, wait: bool = True, timeout: float | None = None) -> bool:
+        if self.loop is not None:
+            self.__signal(self.__stopping)
+            self.__signal(self.__wake)
+        drained = super().shutdown(wait, timeout)
+        self.executor.shutdown(wait=wait and drained)
+        return drained
@@ -0,0 +1,105 @@
+import fcntl
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from config import Config
+from libraries import GVMLogger
+from libraries.common import is_root
+
+
+class GVMWorkspaceManager:
+    LOCK_FILE = ".lock"
+
+    def __init__(
+        self,
+        logger: GVMLogger,
+        root: Path | str | None = None,
+        max_bytes: int | None = None,
+        owner: str | None = None,
+    ):
+        self.root: Path = Path(root or Config.CACHE_PATH)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.CACHE_MAX_BYTES
+        self.owner = owner if owner is not None else Config.ALT_USER
+        self.__write_log: function = logger.write_log
+
+    @contextmanager
+    def workspace(self, name: str):
+        path = self.root / name
+        if path.exists():
+            # Left behind by an earlier attempt of the same job
+            shutil.rmtree(path)
+        path.mkdir(parents=True)
+        if self.owner and is_root():
+            # The export scripts run as ALT_USER and write their CSV in here
+            shutil.chown(path, user=self.owner)
+
+        # The lock is held for the whole job, so no process collects a workspace in use
+        with open(path / self.LOCK_FILE, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield path
+            except BaseException:
+                self.__write_log(
+                    f"Keeping workspace {path} of the failed job", GVMLogger.WARN
+                )
+                raise
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                self.collect()
+
+    def __in_use(self, path: Path) -> bool:
+        if not path.is_dir():
+            return False
+        try:
+            with open(path / self.LOCK_FILE, "r") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        except FileNotFoundError:
+            pass
+        return False
+
+    @staticmethod
+    def __usage(path: Path) -> tuple[int, float]:
+        # Size and the time the entry was last written, directories count their contents
+        stat = path.stat()
+        if not path.is_dir():
+            return stat.st_size, stat.st_mtime
+
+        size, last_used = 0, stat.st_mtime
+        for child in path.rglob("*"):
+            try:
+                child_stat = child.stat()
+            except FileNotFoundError:
+                continue
+            size += child_stat.st_size
+            last_used = max(last_used, child_stat.st_mtime)
+        return size, last_used
+
+    def collect(self):
+        if self.max_bytes <= 0 or not self.root.is_dir():
+            return
+
+        entries = []
+        for path in self.root.iterdir():
+            try:
+                entries.append((path, *self.__usage(path)))
+            except FileNotFoundError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        # Least recently used entries go first until the cache fits again
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self.max_bytes:
+                break
+            if self.__in_use(path):
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            total -= size
+            self.__write_log(
+                f"Removed {path} ({size} bytes) from the cache", GVMLogger.INFO
+            )
@@ -0,0 +1,79 @@
+# Settings of the hooks server, "gvm_commands.py start_hooks" runs
+# gunicorn -c gunicorn.conf.py gvm_commands:app
+import importlib
+import os
+import signal
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+if "config" in sys.modules:
+    # SIGHUP reads this file again, workers forked afterwards inherit the reloaded config
+    importlib.reload(sys.modules["config"])
+
+from config import Config
+
+bind = f"{Config.HOST}:{Config.PORT}"
+chdir = str(Config.CWD)
+workers = Config.GUNICORN_WORKERS
+worker_class = Config.GUNICORN_WORKER_CLASS
+threads = Config.GUNICORN_THREADS
+preload_app = Config.GUNICORN_PRELOAD
+timeout = Config.GUNICORN_TIMEOUT
+graceful_timeout = Config.GUNICORN_GRACEFUL_TIMEOUT
+keepalive = Config.GUNICORN_KEEPALIVE
+# The workers rotate the hooks log, the master only reopens it when told so below. Our
+# logging is not imported by the master, reload_hooks would keep its old code otherwise
+errorlog = Config.HOOKS_LOG_FILE
+
+# An exiting worker no longer updates its heartbeat file, the master kills it after
+# timeout and, on shutdown, after graceful_timeout. Jobs still running then are never
+# handed back, so the drain ends DRAIN_MARGIN seconds before either
+DRAIN_MARGIN = 5
+drain_timeout = max(
+    min(
+        Config.HOOKS_DRAIN_TIMEOUT,
+        Config.GUNICORN_TIMEOUT - DRAIN_MARGIN,
+        Config.GUNICORN_GRACEFUL_TIMEOUT - DRAIN_MARGIN,
+    ),
+    0,
+)
+
+
+def check_drain_timeout(server):
+    if drain_timeout < Config.HOOKS_DRAIN_TIMEOUT:
+        server.log.warning(
+            "HOOKS_DRAIN_TIMEOUT of %ss is cut to %ss, it has to end before "
+            "GUNICORN_TIMEOUT and GUNICORN_GRACEFUL_TIMEOUT",
+            Config.HOOKS_DRAIN_TIMEOUT,
+            drain_timeout,
+        )
+
+
+on_starting = on_reload = check_drain_timeout
+
+
+def post_worker_init(worker):
+    # Shipping workers run in the gunicorn workers only, a preloaded app is imported by
+    # the master as well
+    from gvm_commands import gvm_hooks_instance
+    from libraries.logs import GVMRotatingFileHandler
+
+    gvm_hooks_instance.start_workers()
+
+    def reopen_errorlog(path):
+        # SIGUSR1 makes the master and every worker reopen the gunicorn log files
+        if str(path) == os.path.abspath(Config.HOOKS_LOG_FILE):
+            os.kill(worker.ppid, signal.SIGUSR1)
+
+    GVMRotatingFileHandler.listeners.append(reopen_errorlog)
+
+
+def worker_exit(server, worker):
+    # SIGTERM and SIGHUP stop the old workers gracefully, running jobs are drained first
+    gvm_commands = sys.modules.get("gvm_commands")
+    if gvm_commands is not None:
+        gvm_commands.gvm_hooks_instance.stop_workers(drain_timeout)
+    logs = sys.modules.get("libraries.logs")
+    if logs is not None:
+        logs.GVMLogger.flush_writer()
@@ -1,21 +1,30 @@
 #!/usr/bin/python3
 import argparse
 import os
+import shutil
+import signal
 import subprocess
 import sys
+import time
 from pathlib import Path
 
 from config import Config
 from libraries import GVMLogger
 from classes.gvm_hooks import GVMHooks
-from libraries.common import load_allowed_ips, is_root
+from libraries.common import is_root
 from classes.gvm_archive import GVMArchive
+from classes.gvm_report import GVMReport
+from classes.gvm_index import GVMShipIndex
+from classes.gvm_benchmark import GVMBenchmark
+from classes.gvm_fake_gvmd import GVMFakeGvmd
+from classes.gvm_load_test import GVMLoadTest
+from libraries.synthetic import GVMReportGenerator
 
 
 global app
-gvm_hooks_instance = GVMHooks(allowed_ips=load_allowed_ips(Config.ALLOWED_IP_FILE))
+gvm_hooks_instance = GVMHooks()
 app = gvm_hooks_instance.app
-write_log = GVMLogger(__name__, Config.HOOKS_LOG_FILE).write_log
+write_log = GVMLogger.get(__name__, Config.HOOKS_LOG_FILE).write_log
 
 if not is_root():
     gvm_hooks_instance.__write_log("Script must be run as root")
@@ -29,17 +38,24 @@ def start_server():
         )
         sys.exit(1)
 
-    with open(Config.HOOKS_LOG_FILE, "a") as log_file:
+    # Metric snapshots of the previous server processes would be counted again
+    shutil.rmtree(Config.METRICS_PATH, ignore_errors=True)
+
+    # Only the gunicorn workers serving the hooks run shipping jobs, never the CLI,
+    # they are started and drained by the hooks in gunicorn.conf.py
+    # gunicorn logs to HOOKS_LOG_FILE itself, its output file only gets what it prints
+    with open(Config.GUNICORN_OUTPUT_FILE, "a") as log_file:
         process = subprocess.Popen(
             [
                 "nohup",
                 "gunicorn",
-                "-b",
-                f"{Config.HOST}:{Config.PORT}",
+                "-c",
+                f"{Config.CWD}/gunicorn.conf.py",
                 "gvm_commands:app",
             ],
             stdout=log_file,
             stderr=subprocess.STDOUT,
+            cwd=Config.CWD,
         )
 
     with open(Config.PID_FILE, "w") as pid_file:
@@ -50,16 +66,28 @@ def start_server():
     )
 
 
-def stop_server():
+def read_pid() -> int:
     if not os.path.exists(Config.PID_FILE):
         write_log("Server is not running.")
         sys.exit(1)
 
     with open(Config.PID_FILE, "r") as pid_file:
-        pid = int(pid_file.read().strip())
+        return int(pid_file.read().strip())
+
+
+def stop_server():
+    pid = read_pid()
 
     try:
-        os.kill(pid, 15)  # Send SIGTERM
+        # gunicorn stops accepting and drains the shipping jobs of its workers first
+        os.kill(pid, signal.SIGTERM)
+        write_log(f"Stopping server with PID {pid}")
+        deadline = time.monotonic() + Config.GUNICORN_GRACEFUL_TIMEOUT + 10
+        while time.monotonic() < deadline:
+            os.kill(pid, 0)
+            time.sleep(0.5)
+        write_log(f"Server with PID {pid} is still stopping")
+    except ProcessLookupError:
         write_log(f"Server stopped with PID {pid}")
     except OSError as e:
         write_log(f"Error stopping server: {e}")
@@ -68,14 +96,138 @@ def stop_server():
         os.remove(Config.PID_FILE)
 
 
+def reload_server():
+    pid = read_pid()
+
+    # New workers start with the reloaded code and config before the old ones drain
+    try:
+        os.kill(pid, signal.SIGHUP)
+    except OSError as e:
+        write_log(f"Error reloading server: {e}")
+        sys.exit(1)
+    write_log(f"Server with PID {pid} is reloading")
+
+
 def archive_data():
-    logger = GVMLogger(
+    logger = GVMLogger.get(
         f"{Path(__file__).stem}.{GVMArchive.__qualname__}", Config.ARCHIVE_LOG_FILE
     )
     file_manager = GVMArchive(Config.ARCHIVE_PATH, Config.OUTPUT_PATH, logger)
     file_manager.archive_output()
 
 
+def reset_ship_index():
+    # The next job of every report ships all of its results again
+    logger = GVMLogger.get(
+        f"{Path(__file__).stem}.{GVMShipIndex.__qualname__}", Config.REPORT_LOG_FILE
+    )
+    GVMShipIndex(Config.SHIP_INDEX_FILE, logger).reset()
+
+
+def benchmark_ingest(report_id: str):
+    report = GVMReport(host_name=Config.HOST)
+    benchmark = report.benchmark_ingest(report_id)
+    for ingest in report.INGESTS:
+        print(f"{ingest}: {benchmark[ingest]}")
+    print(f"Identical records: {benchmark['identical']}")
+
+
+def benchmark(*sizes: str):
+    logger = GVMLogger.get(
+        f"{Path(__file__).stem}.{GVMBenchmark.__qualname__}", Config.REPORT_LOG_FILE
+    )
+    benchmark, previous = GVMBenchmark(logger).run(
+        [int(size) for size in sizes] or GVMBenchmark.SIZES
+    )
+    previous_results = {
+        result["rows"]: result
+        for result in (previous or {}).get("results", [])
+        if previous["engine"] == benchmark["engine"]
+    }
+
+    print(f"Engine: {benchmark['engine']}, chunk size: {benchmark['chunk_size']}")
+    for result in benchmark["results"]:
+        line = (
+            f"{result['rows']:>9} rows: {result['seconds']:>8.3f}s, "
+            f"{result['rows_per_second']:>8} rows/s, "
+            f"{result['bytes_per_second'] / 1024 / 1024:>7.1f} MiB/s, "
+            f"peak {result['peak_rss_bytes'] / 1024 / 1024:.0f} MiB"
+        )
+        before = previous_results.get(result["rows"])
+        if before:
+            change = result["rows_per_second"] / before["rows_per_second"] - 1
+            line += f" ({change:+.1%} rows/s since {previous['started']})"
+        print(line)
+
+
+def generate_report(output_file: str, rows: str = "10000", seed: str = "0"):
+    GVMReportGenerator(int(rows), int(seed)).write_csv(output_file)
+    print(f"Report of {rows} rows written to {output_file}")
+
+
+def fake_gvmd(
+    socket_path: str = Config.FAKE_GVMD_SOCKET_PATH,
+    results: str = "1000",
+    latency: str = "0",
+    result_latency: str = "0",
+):
+    logger = GVMLogger.get(
+        f"{Path(__file__).stem}.{GVMFakeGvmd.__qualname__}", Config.HOOKS_LOG_FILE
+    )
+    server = GVMFakeGvmd(
+        socket_path,
+        logger,
+        results=int(results),
+        latency=float(latency),
+        result_latency=float(result_latency),
+        username=Config.USERNAME or None,
+        password=Config.PASSWORD or None,
+    ).start()
+    print(
+        f"Fake gvmd listening on {socket_path}, point GMP_SOCKET_PATH at it. "
+        "Stop with Ctrl+C."
+    )
+    try:
+        signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+def load_test(
+    rate: str = "1",
+    duration: str = "60",
+    shape: str = "constant",
+    tasks: str = "Synthetic task 1",
+    burst_size: str = "10",
+):
+    logger = GVMLogger.get(
+        f"{Path(__file__).stem}.{GVMLoadTest.__qualname__}", Config.HOOKS_LOG_FILE
+    )
+    result = GVMLoadTest(
+        logger,
+        rate=float(rate),
+        duration=float(duration),
+        shape=shape,
+        burst_size=int(burst_size),
+        tasks=tasks.split(","),
+    ).run()
+
+    print(
+        f"{result['triggers']} triggers ({result['shape']}, {result['achieved_rate']}/s): "
+        f"{result['acknowledged']} acknowledged {result['relations']}, "
+        f"{result['dropped']} dropped, {result['errors']} errors"
+    )
+    print(f"Acknowledgement latency (s): {result['ack_latency']}")
+    print(
+        f"{result['jobs']} jobs {result['job_states']}, "
+        f"{result['jobs_unfinished']} unfinished"
+    )
+    print(f"Completion latency (s): {result['completion_latency']}")
+    print(f"Queue depth: {result['max_queued']} queued, {result['max_running']} running")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Controller for gvm")
     parser.add_argument(
@@ -91,10 +243,21 @@ def main():
     elif args.action == "stop_hooks":
         stop_server()
     elif args.action == "reload_hooks":
-        stop_server()
-        start_server()
+        reload_server()
     elif args.action == "archive":
         archive_data()
+    elif args.action == "reset_ship_index":
+        reset_ship_index()
+    elif args.action == "benchmark_ingest":
+        benchmark_ingest(*args.args)
+    elif args.action == "benchmark":
+        benchmark(*args.args)
+    elif args.action == "generate_report":
+        generate_report(*args.args)
+    elif args.action == "fake_gvmd":
+        fake_gvmd(*args.args)
+    elif args.action == "load_test":
+        load_test(*args.args)
     else:
         try:
             command = [
@@ -107,6 +270,8 @@ def main():
                 "--gmp-password",
                 Config.PASSWORD,
                 "socket",
+                "--socketpath",
+                Config.GMP_SOCKET_PATH,
                 f"{Config.SCRIPTS_PATH}/{args.action}",
             ] + args.args
             result = subprocess.run(
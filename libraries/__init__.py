@@ -1,3 +1,5 @@
 from .common import *
 from .logs import GVMLogger
+from .writers import GVMSyslogWriter
 
+from .stats import GVMJobCancelled, GVMShipStats
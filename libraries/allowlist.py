@@ -0,0 +1,141 @@
+import ipaddress
+import os
+import threading
+import time
+from pathlib import Path
+from libraries.logs import GVMLogger
+
+IPNetwork = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+class GVMAllowList:
+    # Used when there is no allow-list file
+    DEFAULT = ["127.0.0.1", "::1"]
+    BITS = {4: 32, 6: 128}
+
+    def __init__(
+        self,
+        file_path: Path | str | None,
+        logger: GVMLogger,
+        reload_interval: float = 1.0,
+    ):
+        self.file_path: Path | None = Path(file_path) if file_path else None
+        self.reload_interval = reload_interval
+        self.__write_log: function = logger.write_log
+
+        self.__lock = threading.Lock()
+        self.__checked = 0.0
+        self.__stamp: tuple[int, int] | None = None
+        # Per IP version the prefix lengths in use, longest first, and the networks of
+        # each length as integers shifted by their host bits. A lookup is one set
+        # membership test per prefix length, however many entries the file has
+        self.__networks: dict[int, tuple[list[int], dict[int, set[int]]]] = {}
+        self.entries: list[IPNetwork] = []
+        self.reload()
+
+    @classmethod
+    def parse(cls, lines: list[str]) -> tuple[list[IPNetwork], list[str]]:
+        entries, invalid = [], []
+        for line in lines:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            try:
+                # Host bits are ignored, so 10.1.2.3/24 allows 10.1.2.0/24
+                entries.append(ipaddress.ip_network(line, strict=False))
+            except ValueError:
+                invalid.append(line)
+        return entries, invalid
+
+    def set_entries(self, entries: list[IPNetwork | str]):
+        networks: dict[int, dict[int, set[int]]] = {}
+        parsed = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = ipaddress.ip_network(entry, strict=False)
+            parsed.append(entry)
+            host_bits = self.BITS[entry.version] - entry.prefixlen
+            networks.setdefault(entry.version, {}).setdefault(
+                entry.prefixlen, set()
+            ).add(int(entry.network_address) >> host_bits)
+
+        # Swapped in one assignment, requests never see a half built list
+        self.__networks = {
+            version: (sorted(lengths, reverse=True), lengths)
+            for version, lengths in networks.items()
+        }
+        self.entries = parsed
+
+    def __file_stamp(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self):
+        stamp = self.__file_stamp() if self.file_path else None
+        if stamp is None:
+            if self.file_path:
+                self.__write_log(
+                    f"Allow-list {self.file_path} does not exist, allowing "
+                    f"{', '.join(self.DEFAULT)} only",
+                    GVMLogger.WARN,
+                )
+            self.__stamp = None
+            self.set_entries(self.DEFAULT)
+            return
+
+        try:
+            with open(self.file_path, "r") as file:
+                entries, invalid = self.parse(file.readlines())
+        except OSError as e:
+            # A file being replaced keeps the previous list until the next change
+            self.__write_log(
+                f"Error reading allow-list {self.file_path}: {e}", GVMLogger.ERROR
+            )
+            return
+
+        for line in invalid:
+            self.__write_log(
+                f"Ignoring invalid allow-list entry {line!r} in {self.file_path}",
+                GVMLogger.WARN,
+            )
+        self.__stamp = stamp
+        self.set_entries(entries)
+        self.__write_log(
+            f"Loaded {len(entries)} allow-list entries from {self.file_path}",
+            GVMLogger.INFO,
+        )
+
+    def check_reload(self):
+        # Requests stat the file at most once every reload_interval seconds
+        now = time.monotonic()
+        if self.file_path is None or now - self.__checked < self.reload_interval:
+            return
+        if not self.__lock.acquire(blocking=False):
+            return
+        try:
+            self.__checked = now
+            if self.__file_stamp() != self.__stamp:
+                self.reload()
+        finally:
+            self.__lock.release()
+
+    def allows(self, address: str | None) -> bool:
+        self.check_reload()
+        try:
+            ip = ipaddress.ip_address(address or "")
+        except ValueError:
+            return False
+        # Dual stack sockets report IPv4 clients as ::ffff:a.b.c.d
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+
+        lengths, networks = self.__networks.get(ip.version, ((), {}))
+        value = int(ip)
+        bits = self.BITS[ip.version]
+        return any(value >> (bits - length) in networks[length] for length in lengths)
+
+    def __contains__(self, address: str | None) -> bool:
+        return self.allows(address)
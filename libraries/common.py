@@ -1,10 +1,20 @@
 import os
+import uuid
+import numpy as np
+import pandas as pd
 
 
 def is_root():
     return os.geteuid() == 0
 
 
+def is_uuid(value: str) -> bool:
+    try:
+        return str(uuid.UUID(value)) == value.lower()
+    except (TypeError, ValueError):
+        return False
+
+
 def convert_floats_to_ints(data):
     if isinstance(data, dict):
         return {k: convert_floats_to_ints(v) for k, v in data.items()}
@@ -16,15 +26,29 @@ def convert_floats_to_ints(data):
         return data
 
 
-def load_allowed_ips(file_path: str):
-    if not file_path or not os.path.isfile(file_path):
-        raise (f"File {file_path} does not exist")
+def normalize_value(value):
+    if pd.isna(value):
+        return None
+    elif isinstance(value, str):
+        return value.strip()
+    return convert_floats_to_ints(value)
 
-    allowed_ips = []
-    try:
-        with open(file_path, "r") as file:
-            allowed_ips = [line.strip() for line in file if line.strip()]
-    except Exception as e:
-        raise (f"Error reading allowed IPs from file: {e}")
 
-    return allowed_ips
+def normalize_column(column: pd.Series) -> np.ndarray:
+    # Column-wise equivalent of stripping, NaN to None and convert_floats_to_ints
+    if pd.api.types.is_float_dtype(column.dtype):
+        raw = column.to_numpy(dtype=float)
+        values = column.to_numpy(dtype=object, na_value=None, copy=True)
+        integral = np.isfinite(raw) & (raw == np.floor(raw))
+        values[integral] = [int(value) for value in raw[integral].tolist()]
+        return values
+
+    if pd.api.types.is_integer_dtype(column.dtype) or pd.api.types.is_bool_dtype(
+        column.dtype
+    ):
+        return column.to_numpy(dtype=object, copy=True)
+
+    if pd.api.types.infer_dtype(column, skipna=True) in ("string", "empty"):
+        return column.str.strip().to_numpy(dtype=object, na_value=None, copy=True)
+
+    return np.array([normalize_value(value) for value in column], dtype=object)
@@ -0,0 +1,203 @@
+from typing import BinaryIO, Iterator
+from lxml import etree
+
+# Columns of the "CSV Results" report format, in order
+CSV_COLUMNS = [
+    "IP",
+    "Hostname",
+    "Port",
+    "Port Protocol",
+    "CVSS",
+    "Severity",
+    "QoD",
+    "Solution Type",
+    "NVT Name",
+    "Summary",
+    "Specific Result",
+    "NVT OID",
+    "CVEs",
+    "Task ID",
+    "Task Name",
+    "Timestamp",
+    "Result ID",
+    "Impact",
+    "Solution",
+    "Affected Software/OS",
+    "Vulnerability Insight",
+    "Vulnerability Detection Method",
+    "Product Detection Result",
+    "BIDs",
+    "CERTs",
+    "Other References",
+]
+# Read as numbers, every other column is text even when its values look numeric
+CSV_NUMERIC_COLUMNS = ["Port", "CVSS", "QoD"]
+
+CERT_REFERENCE_TYPES = ["cert-bund", "dfn-cert"]
+
+
+def _text(element: etree._Element | None, path: str | None = None) -> str | None:
+    if element is not None and path is not None:
+        element = element.find(path)
+    if element is None or element.text is None:
+        return None
+    return element.text or None
+
+
+def _join(values: list[str]) -> str | None:
+    return ",".join(values) if values else None
+
+
+def _parse_tags(tags: str | None) -> dict:
+    parsed = {}
+    for tag in (tags or "").split("|"):
+        name, _, value = tag.partition("=")
+        parsed[name] = value or None
+    return parsed
+
+
+def _parse_port(port: str | None) -> tuple[int | None, str | None]:
+    number, _, protocol = (port or "").partition("/")
+    if not number.isdigit():
+        return None, None
+    return int(number), protocol or None
+
+
+def _detection(result: etree._Element) -> str | None:
+    details = {
+        detail.findtext("name"): detail.findtext("value")
+        for detail in result.iterfind("detection/result/details/detail")
+    }
+    if "product" not in details:
+        return None
+    return (
+        f"Product: {details['product']}\n"
+        f"Method: {details.get('source_name', '')}\n"
+        f"(OID: {details.get('source_oid', '')})\n"
+    )
+
+
+def result_to_row(
+    result: etree._Element,
+    task_id: str | None = None,
+    task_name: str | None = None,
+    timestamp: str | None = None,
+) -> dict:
+    # Mirrors the "CSV Results" report format so rows match the CSV ingest path
+    nvt = result.find("nvt")
+    tags = _parse_tags(_text(nvt, "tags"))
+    references = {}
+    for reference in nvt.iterfind("refs/ref") if nvt is not None else []:
+        kind = reference.get("type", "").lower()
+        if kind in CERT_REFERENCE_TYPES:
+            kind = "cert"
+        references.setdefault(kind, []).append(reference.get("id"))
+
+    port, protocol = _parse_port(_text(result, "port"))
+    severity = _text(result, "severity")
+    qod = _text(result, "qod/value")
+    oid = nvt.get("oid") if nvt is not None else None
+    name = _text(nvt, "name")
+    solution = nvt.find("solution") if nvt is not None else None
+
+    return {
+        "IP": _text(result, "host"),
+        "Hostname": _text(result, "host/hostname"),
+        "Port": port,
+        "Port Protocol": protocol,
+        "CVSS": float(severity) if severity is not None else None,
+        "Severity": _text(result, "threat"),
+        "QoD": int(qod) if qod is not None else None,
+        "Solution Type": solution.get("type") if solution is not None else None,
+        # The CSV report format drops quotes from this column only
+        "NVT Name": name.replace("'", "").replace('"', "") if name else None,
+        "Summary": tags.get("summary"),
+        "Specific Result": _text(result, "description"),
+        "NVT OID": oid,
+        "CVEs": _join(references.get("cve", [])),
+        "Task ID": task_id,
+        "Task Name": task_name,
+        "Timestamp": timestamp or _text(result, "creation_time"),
+        "Result ID": result.get("id"),
+        "Impact": tags.get("impact"),
+        "Solution": _text(solution),
+        "Affected Software/OS": tags.get("affected"),
+        "Vulnerability Insight": tags.get("insight"),
+        "Vulnerability Detection Method": (
+            f"{tags.get('vuldetect') or ''}\nDetails:\n{name or ''}\n"
+            f"(OID: {oid or ''})\nVersion used: {_text(result, 'scan_nvt_version') or ''}\n"
+        ),
+        "Product Detection Result": _detection(result),
+        "BIDs": _join(references.get("bid", [])),
+        "CERTs": _join(references.get("cert", [])),
+        "Other References": _join(references.get("url", [])),
+    }
+
+
+class GVMResultParser:
+    # Incremental parse fed chunk by chunk, every handled <result> is dropped from the tree right away
+    READ_SIZE = 256 * 1024
+
+    def __init__(self):
+        self.task_id = self.task_name = self.timestamp = None
+        self.__parser = etree.XMLPullParser(
+            events=("end",), tag=("task", "timestamp", "result"), huge_tree=True
+        )
+
+    def feed(self, data: bytes) -> list[dict]:
+        self.__parser.feed(data)
+        return list(self.__rows())
+
+    def close(self) -> list[dict]:
+        self.__parser.close()
+        return list(self.__rows())
+
+    def __rows(self) -> Iterator[dict]:
+        for _, element in self.__parser.read_events():
+            parent = element.getparent()
+            parent_tag = parent.tag if parent is not None else None
+
+            if (
+                element.tag == "task"
+                and parent_tag == "report"
+                and self.task_id is None
+            ):
+                self.task_id = element.get("id")
+                self.task_name = _text(element, "name")
+            elif (
+                element.tag == "timestamp"
+                and parent_tag == "report"
+                and self.timestamp is None
+            ):
+                self.timestamp = _text(element)
+            elif element.tag == "result" and parent_tag == "results":
+                yield result_to_row(
+                    element, self.task_id, self.task_name, self.timestamp
+                )
+
+                element.clear()
+                while element.getprevious() is not None:
+                    del parent[0]
+
+
+def iter_result_rows(source: BinaryIO) -> Iterator[dict]:
+    parser = GVMResultParser()
+    while data := source.read(GVMResultParser.READ_SIZE):
+        yield from parser.feed(data)
+    yield from parser.close()
+
+
+def iter_report_rows(report: etree._Element) -> Iterator[dict]:
+    # Same mapping for a report that is already parsed, e.g. a GMP response
+    inner = report.find("report")
+    if inner is None:
+        inner = report
+    task = inner.find("task")
+
+    for result in inner.iterfind("results/result"):
+        yield result_to_row(
+            result,
+            task.get("id") if task is not None else None,
+            _text(task, "name"),
+            _text(inner, "timestamp"),
+        )
@@ -1,8 +1,29 @@
+import atexit
+import copy
+import fcntl
+import gzip
 import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
 from datetime import datetime
+from typing import Callable
 from config import Config
 
+CORRELATION_ENV = "GVM_CORRELATION_ID"
+# Child scripts inherit the ID of the request that started them through the environment
+CORRELATION_ID: ContextVar[str | None] = ContextVar(
+    "gvm_correlation_id", default=os.environ.get(CORRELATION_ENV)
+)
+SPANS: ContextVar[tuple[str, ...]] = ContextVar("gvm_spans", default=())
+
 
 class GVMLoggingFormatter(logging.Formatter):
     def formatTime(self, record, datefmt=None):
@@ -12,6 +33,293 @@ class GVMLoggingFormatter(logging.Formatter):
         return datetime.fromtimestamp(record.created).astimezone().strftime(datefmt)
 
 
+class GVMCorrelationFilter(logging.Filter):
+    def filter(self, record):
+        # Records written in the background got their ID on the thread that logged them
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = CORRELATION_ID.get() or "-"
+        return True
+
+
+class GVMRotatingFileHandler(logging.FileHandler):
+    # Called with the log file path after this process rotated it
+    listeners: list[Callable[[Path], None]] = []
+
+    def __init__(
+        self,
+        file_path: Path | str,
+        max_bytes: int | None = None,
+        interval: int | None = None,
+        keep: int | None = None,
+        compress: bool | None = None,
+    ):
+        super().__init__(file_path)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.LOG_ROTATE_BYTES
+        self.interval = interval if interval is not None else Config.LOG_ROTATE_INTERVAL
+        self.keep = keep if keep is not None else Config.LOG_ROTATE_KEEP
+        self.compress = compress if compress is not None else Config.LOG_ROTATE_COMPRESS
+        self.path = Path(self.baseFilename)
+        # Every process writing the file rotates under this lock, the lock file holds
+        # the time the current log file was started
+        self.lock_path = self.path.with_name(f".{self.path.name}.lock")
+        self.__pattern = re.compile(
+            rf"{re.escape(self.path.name)}\.(\d{{8}}-\d{{6}})(?:-(\d+))?(\.gz)?"
+        )
+        self.__rollover_at = self.__period_start(time.time()) + (self.interval or 0)
+        if self.interval:
+            with self.__locked() as lock_file:
+                if not lock_file.read().strip():
+                    lock_file.write(repr(time.time()))
+
+    @contextmanager
+    def __locked(self):
+        with open(self.lock_path, "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            lock_file.seek(0)
+            yield lock_file
+
+    def __period_start(self, now: float) -> float:
+        # Periods are aligned to local time, a daily interval rotates at midnight
+        if not self.interval:
+            return 0.0
+        offset = datetime.fromtimestamp(now).astimezone().utcoffset().total_seconds()
+        return now - (now + offset) % self.interval
+
+    def __follow(self) -> int:
+        # Switches to the new file once another process rotated it, nothing is written
+        # to a rotated file after the next record of this process
+        opened = os.fstat(self.stream.fileno())
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            current = None
+        if current is None or (current.st_dev, current.st_ino) != (
+            opened.st_dev,
+            opened.st_ino,
+        ):
+            self.stream.close()
+            self.stream = self._open()
+            opened = os.fstat(self.stream.fileno())
+        return opened.st_size
+
+    def emit(self, record: logging.LogRecord):
+        if self.stream is not None and (self.max_bytes or self.interval):
+            try:
+                size = self.__follow()
+                if (self.max_bytes and size >= self.max_bytes) or (
+                    self.interval and time.time() >= self.__rollover_at
+                ):
+                    self.__rotate()
+            except OSError:
+                self.handleError(record)
+        super().emit(record)
+
+    def __rotate(self):
+        rotated = None
+        with self.__locked() as lock_file:
+            # Another process may have rotated while this one waited for the lock
+            size = self.__follow()
+            now = time.time()
+            started = float(lock_file.read().strip() or now)
+            expired = self.interval and started < self.__period_start(now)
+
+            if (self.max_bytes and size >= self.max_bytes) or (expired and size):
+                rotated = self.__rotated_path(now)
+                os.rename(self.baseFilename, rotated)
+                self.stream.close()
+                self.stream = self._open()
+                started = now
+            elif expired:
+                started = now
+            lock_file.truncate(0)
+            lock_file.write(repr(started))
+            lock_file.flush()
+            self.__rollover_at = self.__period_start(now) + (self.interval or 0)
+
+        if rotated is not None:
+            self.__cleanup()
+            for listener in self.listeners:
+                listener(self.path)
+
+    def __rotated_path(self, now: float) -> str:
+        stamp = datetime.fromtimestamp(now).strftime("%Y%m%d-%H%M%S")
+        path, count = f"{self.baseFilename}.{stamp}", 0
+        while os.path.exists(path) or os.path.exists(f"{path}.gz"):
+            count += 1
+            path = f"{self.baseFilename}.{stamp}-{count}"
+        return path
+
+    def generations(self) -> list[list[Path]]:
+        # Rotated files, newest first, with the plain and gzipped file of a generation
+        generations: dict[tuple[str, int], list[Path]] = {}
+        for path in self.path.parent.iterdir():
+            match = self.__pattern.fullmatch(path.name)
+            if match:
+                key = (match.group(1), int(match.group(2) or 0))
+                generations.setdefault(key, []).append(path)
+        return [generations[key] for key in sorted(generations, reverse=True)]
+
+    def __cleanup(self):
+        generations = self.generations()
+        for generation in generations[self.keep :]:
+            for path in generation:
+                path.unlink(missing_ok=True)
+        if not self.compress:
+            return
+
+        # The newest rotated file stays plain until the next rotation, processes that
+        # have not followed the rotation yet may still append to it
+        pending = [
+            path
+            for generation in generations[1 : self.keep]
+            for path in generation
+            if path.suffix != ".gz"
+        ]
+        if pending:
+            threading.Thread(
+                target=self.__compress, args=[pending], name="gvm-log-compress"
+            ).start()
+
+    @staticmethod
+    def __compress(paths: list[Path]):
+        for path in paths:
+            temp_path = path.with_name(f".{path.name}.gz.{os.getpid()}")
+            try:
+                with open(path, "rb") as source, gzip.open(temp_path, "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(temp_path, f"{path}.gz")
+                path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                # Compressed or removed by another process in the meantime
+                temp_path.unlink(missing_ok=True)
+
+
+class GVMLogWriter:
+    # One thread writes the records of every asynchronous handler of the process
+    POLICIES = ["block", "drop"]
+
+    def __init__(self, size: int | None = None, policy: str | None = None):
+        policy = policy or Config.LOG_QUEUE_FULL
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown log queue policy: {policy}")
+        self.size = size if size is not None else Config.LOG_QUEUE_SIZE
+        self.policy = policy
+        self.handlers: list[logging.Handler] = []
+        self.__reset()
+        # A fork in the middle of a write would leave the child a locked file buffer
+        os.register_at_fork(
+            before=self.__hold_handlers,
+            after_in_parent=self.__release_handlers,
+            after_in_child=self.__reset,
+        )
+        atexit.register(self.stop)
+
+    def add(self, handler: logging.Handler):
+        self.handlers.append(handler)
+
+    def __hold_handlers(self):
+        for handler in self.handlers:
+            handler.acquire()
+
+    def __release_handlers(self):
+        for handler in self.handlers:
+            handler.release()
+
+    def __reset(self):
+        # Forked children get a queue of their own, the writer thread is not copied
+        self.__lock = threading.Lock()
+        self.__queue: queue.Queue = queue.Queue(self.size)
+        self.__thread: threading.Thread | None = None
+        self.__stopped = False
+        self.__dropped: dict[logging.Handler, int] = {}
+
+    def put(self, handler: logging.Handler, record: logging.LogRecord):
+        if self.__stopped:
+            handler.handle(record)
+            return
+        if self.__thread is None:
+            with self.__lock:
+                if self.__thread is None:
+                    self.__thread = threading.Thread(
+                        target=self.__run, name="gvm-log-writer", daemon=True
+                    )
+                    self.__thread.start()
+
+        try:
+            self.__queue.put((handler, record), block=self.policy == "block")
+        except queue.Full:
+            with self.__lock:
+                self.__dropped[handler] = self.__dropped.get(handler, 0) + 1
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            handler, record = item
+            handler.handle(record)
+            if self.__dropped:
+                self.__write_dropped()
+
+    def __write_dropped(self):
+        with self.__lock:
+            dropped, self.__dropped = self.__dropped, {}
+        for handler, count in dropped.items():
+            handler.handle(
+                logging.makeLogRecord(
+                    {
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": f"Dropped {count} log records, the log queue was full",
+                        "correlation_id": "-",
+                    }
+                )
+            )
+
+    def stop(self, timeout: float | None = None):
+        # Writes everything queued so far, records logged afterwards are written directly
+        with self.__lock:
+            thread, self.__stopped = self.__thread, True
+        if thread is not None:
+            self.__queue.put(None)
+            thread.join(timeout)
+            if thread.is_alive():
+                return
+        while True:
+            try:
+                item = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[0].handle(item[1])
+        self.__write_dropped()
+
+
+class GVMQueueHandler(logging.Handler):
+    def __init__(self, handler: logging.Handler, writer: GVMLogWriter):
+        super().__init__()
+        self.handler = handler
+        self.writer = writer
+        self.addFilter(GVMCorrelationFilter())
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            # The arguments and the traceback are rendered on the logging thread, they
+            # may have changed or be gone by the time the writer gets to the record
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                formatter = self.handler.formatter or logging.Formatter()
+                record.exc_text = record.exc_text or formatter.formatException(
+                    record.exc_info
+                )
+                record.exc_info = None
+            self.writer.put(self.handler, record)
+        except Exception:
+            self.handleError(record)
+
+
 class GVMLogger(logging.Logger):
     NOTSET = logging.NOTSET
     DEBUG = logging.DEBUG
@@ -45,29 +353,84 @@ class GVMLogger(logging.Logger):
         "FATAL": FATAL,
     }
 
+    # Shared by the whole process, see get and file_handler
+    __lock = threading.RLock()
+    __loggers: dict[tuple[str, Path], "GVMLogger"] = {}
+    __handlers: dict[tuple[Path, logging.Formatter, bool], logging.Handler] = {}
+    __writer: GVMLogWriter | None = None
+
     def __init__(
         self,
         name: str,
         file_path: Path | str,
         level: int | str = DEBUG,
         formatter: GVMLoggingFormatter = GVMLoggingFormatter(
-            "[%(asctime)s] [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S.%f %z"
+            "[%(asctime)s] [%(levelname)s] [%(correlation_id)s] %(message)s",
+            "%Y-%m-%d %H:%M:%S.%f %z",
         ),
+        asynchronous: bool | None = None,
     ) -> None:
         super().__init__(name, level)
         self.file_path: Path = Path(file_path)
         self.formatter = formatter
+        self.asynchronous = (
+            asynchronous if asynchronous is not None else Config.LOG_ASYNC
+        )
         self.__setup_logger()
 
     def __setup_logger(self):
-        log_path = self.file_path.parent
-        log_path.mkdir(parents=True, exist_ok=True)
-
-        handler = logging.FileHandler(self.file_path)
-        handler.setFormatter(self.formatter)
-        self.addHandler(handler)
+        self.addHandler(
+            self.file_handler(self.file_path, self.formatter, self.asynchronous)
+        )
         self.propagate = False
 
+    @classmethod
+    def get(
+        cls, name: str, file_path: Path | str, level: int | str = DEBUG
+    ) -> "GVMLogger":
+        # Objects built per job or request log through this instead of constructing
+        # a logger of their own every time
+        key = (name, Path(file_path).resolve())
+        with cls.__lock:
+            logger = cls.__loggers.get(key)
+            if logger is None:
+                logger = cls.__loggers[key] = cls(name, file_path, level)
+        return logger
+
+    @classmethod
+    def file_handler(
+        cls,
+        file_path: Path | str,
+        formatter: logging.Formatter,
+        asynchronous: bool = False,
+    ) -> logging.Handler:
+        # One open file per log file and format, however many loggers write to it
+        key = (Path(file_path).resolve(), formatter, asynchronous)
+        with cls.__lock:
+            handler = cls.__handlers.get(key)
+            if handler is None and asynchronous:
+                # Hands the records to the writer thread, which writes them with the
+                # same handler the synchronous loggers of this file use
+                if cls.__writer is None:
+                    cls.__writer = GVMLogWriter()
+                target = cls.file_handler(file_path, formatter)
+                cls.__writer.add(target)
+                handler = GVMQueueHandler(target, cls.__writer)
+                cls.__handlers[key] = handler
+            elif handler is None:
+                Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+                handler = GVMRotatingFileHandler(file_path)
+                handler.setFormatter(formatter)
+                handler.addFilter(GVMCorrelationFilter())
+                cls.__handlers[key] = handler
+        return handler
+
+    @classmethod
+    def flush_writer(cls, timeout: float | None = None):
+        # Also runs at exit, later records of the process are written synchronously
+        if cls.__writer is not None:
+            cls.__writer.stop(timeout)
+
     def write_log(self, msg: str, level: int = DEBUG):
         if level == self.NOTSET:
             self.debug(f"[NOTSET] {msg}")
@@ -85,10 +448,54 @@ class GVMLogger(logging.Logger):
             # UNKNOWN
             self.warning(f"[UNKNOWN LEVEL {level}] {msg}")
 
+    @staticmethod
+    def new_correlation_id() -> str:
+        return uuid.uuid4().hex[:16]
+
+    @staticmethod
+    @contextmanager
+    def correlate(correlation_id: str | None = None):
+        correlation_id = correlation_id or GVMLogger.new_correlation_id()
+        token = CORRELATION_ID.set(correlation_id)
+        try:
+            yield correlation_id
+        finally:
+            CORRELATION_ID.reset(token)
+
+    @staticmethod
+    def correlation_env() -> dict:
+        correlation_id = CORRELATION_ID.get()
+        if not correlation_id:
+            return dict(os.environ)
+        return {**os.environ, CORRELATION_ENV: correlation_id}
+
+    @contextmanager
+    def span(self, name: str, level: int = INFO):
+        # Nested spans are logged with their full path, e.g. job/ship/ingest
+        spans = SPANS.get() + (name,)
+        token = SPANS.set(spans)
+        path = "/".join(spans)
+        started = time.perf_counter()
+        self.write_log(f"Span {path} started", self.DEBUG)
+        try:
+            yield
+        except BaseException as e:
+            self.write_log(
+                f"Span {path} failed after {time.perf_counter() - started:.3f}s: {e}",
+                self.WARN,
+            )
+            raise
+        else:
+            self.write_log(
+                f"Span {path} finished in {time.perf_counter() - started:.3f}s", level
+            )
+        finally:
+            SPANS.reset(token)
+
 
 # Cara penggunaan:
 if __name__ == "__main__":
-    logger = GVMLogger("gvm_script", Config.SCRIPT_LOG_FILE)
+    logger = GVMLogger.get("gvm_script", Config.SCRIPT_LOG_FILE)
 
     logger.write_log("This is a notset level message", GVMLogger.NOTSET)
     logger.write_log("This is a debug level message", GVMLogger.DEBUG)
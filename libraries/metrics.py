@@ -0,0 +1,254 @@
+import bisect
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable
+
+
+class GVMMetric:
+    TYPE = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [[list(key), value] for key, value in self._values.items()]
+        return {"type": self.TYPE, "help": self.help, "samples": samples}
+
+
+class GVMCounter(GVMMetric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class GVMGauge(GVMMetric):
+    TYPE = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...],
+        function: Callable[[], dict[tuple, float]],
+    ):
+        # Gauges are read from the function when scraped
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def snapshot(self) -> dict:
+        samples = [[list(key), value] for key, value in self.function().items()]
+        return {"type": self.TYPE, "help": self.help, "samples": samples}
+
+
+class GVMHistogram(GVMMetric):
+    TYPE = "histogram"
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # [count per bucket (the last one is +Inf), sum, count]
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            values[0][index] += 1
+            values[1] += value
+            values[2] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [
+                [list(key), [list(counts), total, count]]
+                for key, (counts, total, count) in self._values.items()
+            ]
+        return {
+            "type": self.TYPE,
+            "help": self.help,
+            "buckets": list(self.buckets),
+            "samples": samples,
+        }
+
+
+class GVMMetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, GVMMetric] = {}
+
+    def register(self, metric: GVMMetric) -> GVMMetric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self, scraped: bool = False) -> dict:
+        # Scraped gauges describe shared state, so only the scraping process reports them
+        return {
+            name: metric.snapshot()
+            for name, metric in self.metrics.items()
+            if scraped or not isinstance(metric, GVMGauge)
+        }
+
+    def dump(self, directory: Path | str):
+        # Every server process leaves its own snapshot for whichever process is scraped
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        temp_file = directory / f".{os.getpid()}.json.tmp"
+        temp_file.write_text(json.dumps(self.snapshot()))
+        os.replace(temp_file, directory / f"{os.getpid()}.json")
+
+    def collect(self, directory: Path | str) -> dict:
+        self.dump(directory)
+        merged = self.snapshot(scraped=True)
+        # Own samples come from the file like everyone else's
+        for name, metric in self.metrics.items():
+            if not isinstance(metric, GVMGauge):
+                merged[name]["samples"] = []
+
+        for path in Path(directory).glob("*.json"):
+            if not path.stem.isdigit():
+                continue
+            try:
+                snapshot = json.loads(path.read_text())
+            except (ValueError, OSError):
+                continue
+
+            # Counters of stopped processes still count, gauges are only read here
+            for name, metric in snapshot.items():
+                if name in merged and not isinstance(self.metrics[name], GVMGauge):
+                    self.__merge(merged[name], metric)
+        return merged
+
+    @staticmethod
+    def __merge(target: dict, source: dict):
+        samples = {tuple(key): value for key, value in target["samples"]}
+        for key, value in source["samples"]:
+            key = tuple(key)
+            if key not in samples:
+                samples[key] = value
+            elif target["type"] == "histogram":
+                counts, total, count = samples[key]
+                samples[key] = [
+                    [a + b for a, b in zip(counts, value[0])],
+                    total + value[1],
+                    count + value[2],
+                ]
+            else:
+                samples[key] = samples[key] + value
+        target["samples"] = [[list(key), value] for key, value in samples.items()]
+
+    def render(self, directory: Path | str) -> str:
+        lines = []
+        for name, metric in self.collect(directory).items():
+            labels = self.metrics[name].labels
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in sorted(metric["samples"]):
+                pairs = list(zip(labels, key))
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{self.__labels(pairs)} {value}")
+                    continue
+
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket in zip(metric["buckets"] + ["+Inf"], counts):
+                    cumulative += bucket
+                    lines.append(
+                        f"{name}_bucket{self.__labels(pairs + [('le', bound)])} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{self.__labels(pairs)} {total}")
+                lines.append(f"{name}_count{self.__labels(pairs)} {count}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def __labels(pairs: list[tuple[str, object]]) -> str:
+        if not pairs:
+            return ""
+        escaped = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            for _, value in pairs
+        )
+        return (
+            "{"
+            + ",".join(
+                f'{label}="{value}"' for (label, _), value in zip(pairs, escaped)
+            )
+            + "}"
+        )
+
+
+METRICS = GVMMetricsRegistry()
+
+HOOK_REQUESTS = METRICS.register(
+    GVMCounter(
+        "gvm_hook_requests_total", "Requests to the hooks server", ("route", "status")
+    )
+)
+HOOK_REQUEST_DURATION = METRICS.register(
+    GVMHistogram(
+        "gvm_hook_request_duration_seconds",
+        "Time to answer a hooks request",
+        ("route",),
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    )
+)
+JOB_RUNS = METRICS.register(
+    GVMCounter("gvm_job_runs_total", "Finished shipping job attempts", ("result",))
+)
+JOB_DURATION = METRICS.register(
+    GVMHistogram("gvm_job_duration_seconds", "Wall time of a shipping job attempt")
+)
+STAGE_DURATION = METRICS.register(
+    GVMHistogram(
+        "gvm_stage_duration_seconds",
+        "Time a shipping job spent in each stage",
+        ("stage",),
+    )
+)
+ROWS_INGESTED = METRICS.register(
+    GVMCounter("gvm_rows_ingested_total", "Result rows read from reports")
+)
+ROWS_EMITTED = METRICS.register(
+    GVMCounter("gvm_rows_emitted_total", "Syslog lines written per output")
+)
+ROWS_SKIPPED = METRICS.register(
+    GVMCounter("gvm_rows_skipped_total", "Lines left out as already shipped")
+)
+OUTPUT_BYTES = METRICS.register(
+    GVMCounter("gvm_output_bytes_total", "Bytes appended to OUTPUT_PATH")
+)
+GMP_DURATION = METRICS.register(
+    GVMHistogram(
+        "gvm_gmp_request_duration_seconds",
+        "Latency of pooled GMP requests",
+        ("command",),
+    )
+)
+GMP_ERRORS = METRICS.register(
+    GVMCounter("gvm_gmp_errors_total", "Failed pooled GMP requests", ("command",))
+)
+SUBPROCESS_FAILURES = METRICS.register(
+    GVMCounter(
+        "gvm_subprocess_failures_total", "gvm-script runs that failed", ("script",)
+    )
+)
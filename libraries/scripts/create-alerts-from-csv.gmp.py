@@ -193,6 +193,26 @@ def create_alerts(
                     except GvmResponseError as gvmerr:
                         print(f"{gvmerr=}, name: {alert_name}")
                         pass 
+                elif str_alert_type == "HTTP_GET":
+                    # gvmd fills in $n (task name), $e (event) and $c (condition) only
+                    http_get_url = strRow2
+                    try:
+                        print("Creating alert: " + alert_name)
+                        gmp.create_alert(
+                            name=alert_name,
+                            comment=comment,
+                            event=gmp.types.AlertEvent.TASK_RUN_STATUS_CHANGED,
+                            event_data={"status": event_data},
+                            condition=gmp.types.AlertCondition.ALWAYS,
+                            method=alert_type,
+                            method_data={
+                                "URL": http_get_url,
+                            },
+                        )
+                        numberalerts = numberalerts + 1
+                    except GvmResponseError as gvmerr:
+                        print(f"{gvmerr=}, name: {alert_name}")
+                        pass 
                 else:
                     smb_credential = credential_id(gmp, strRow2)
                     smb_share_path = strRow3
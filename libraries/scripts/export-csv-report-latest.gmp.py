@@ -29,24 +29,120 @@ from gvmtools.helper import Table
 
 from argparse import ArgumentParser, Namespace, RawTextHelpFormatter
 
+import os
 import sys
+import time
 from base64 import b64decode
 from pathlib import Path
+from uuid import UUID
 
 HELP_TEXT = "This script exports the latest finished scan "
 
+CORRELATION_ID = os.environ.get("GVM_CORRELATION_ID", "-")
+
+
+def log(message: str):
+    # Timings and errors go to stderr, the hooks log them with the request they belong to
+    print(f"[{CORRELATION_ID}] {message}", file=sys.stderr)
+
 
 def get_latest_report_id(gmp: Gmp):
+    # Only the newest finished report is requested, without its results
     response_xml = gmp.get_reports(
-        ignore_pagination=True,
-        details=True,
-        filter_string="status=Done  and sort-reverse=modified  and rows=-1",
+        details=False,
+        filter_string="status=Done sort-reverse=modified first=1 rows=1",
     )
 
     reports_xml = response_xml.xpath("report")
+    if not reports_xml:
+        log("No finished report found.")
+        sys.exit(1)
     return reports_xml[0].get("id")
 
 
+def task_filter(task: str):
+    # Alerts only know the task name, so a task is matched by ID or exact name
+    try:
+        if str(UUID(task)) == task.lower():
+            return f"uuid={task} rows=1"
+    except ValueError:
+        pass
+    return f'name="{task}" rows=1'
+
+
+def get_task_report_id(gmp: Gmp, task: str):
+    # gvmd keeps the last finished report of every task
+    response_xml = gmp.get_tasks(details=False, filter_string=task_filter(task))
+
+    tasks_xml = response_xml.xpath("task")
+    if not tasks_xml:
+        log(f"Task {task} not found.")
+        sys.exit(1)
+    report = tasks_xml[0].find("last_report/report")
+    if report is None:
+        log(f"Task {task} has no finished report.")
+        sys.exit(1)
+    return report.get("id")
+
+
+def count_results(gmp: Gmp, report_id: str):
+    response = gmp.get_report(report_id=report_id, details=False)
+    count = response.findtext("report/report/result_count/filtered")
+    return int(count) if count else None
+
+
+def get_csv_pages(gmp: Gmp, report_id: str, page_size: int):
+    # without a page size the whole report is requested at once
+    total = count_results(gmp, report_id) if page_size > 0 else None
+    if total is None:
+        filters = [None]
+    else:
+        filters = [
+            f"first={first} rows={page_size}"
+            for first in range(1, max(total, 1) + 1, page_size)
+        ]
+
+    csv_report_format_id = "c1645568-627a-11e3-a660-406186ea4fc5"
+    header_written = False
+
+    for index, filter_string in enumerate(filters):
+        started = time.perf_counter()
+        response = gmp.get_report(
+            report_id=report_id,
+            report_format_id=csv_report_format_id,
+            filter_string=filter_string,
+            ignore_pagination=filter_string is None,
+            details=True,
+        )
+
+        report_element = response.find("report")
+        # get the full content of the report element
+        content = report_element.find("report_format").tail
+        if not content:
+            continue
+
+        # convert content to 8-bit ASCII bytes and decode base64
+        binary_csv = b64decode(content.encode("ascii"))
+
+        # every page starts with the header row
+        if header_written:
+            binary_csv = binary_csv.partition(b"\n")[2]
+        header_written = True
+        elapsed = time.perf_counter() - started
+        log(f"Fetched page {index + 1}/{len(filters)} in {elapsed:.3f}s")
+
+        yield binary_csv
+
+
+def write_csv_pages(gmp: Gmp, report_id: str, csv_path: Path, page_size: int):
+    written = False
+    with csv_path.open("wb") as csv_file:
+        for binary_csv in get_csv_pages(gmp, report_id, page_size):
+            csv_file.write(binary_csv)
+            written = True
+    return written
+
+
 def check_args(args):
     len_args = len(args.script) - 1
     if len_args < 1:
@@ -55,6 +151,10 @@ def check_args(args):
         file locally. It requires one parameter after the script name.
 
         1. <file_name>     -- file name to save the csv in.
+
+        Optional a page size, results are then fetched in pages of that size.
+        Optional a task id or name after the page size, the latest finished
+        report of that task is exported instead.
         
         Examples:
             $ gvm-script --gmp-username name --gmp-password pass \
@@ -72,41 +172,29 @@ def main(gmp: Gmp, args: Namespace) -> None:
 
     print("Exporting latest report.\n")
 
-    report_id = get_latest_report_id(gmp)
     csv_filename = f"{args.argv[1]}.csv"
 
-    csv_report_format_id = "c1645568-627a-11e3-a660-406186ea4fc5"
+    page_size = int(args.argv[2]) if len(args.argv) > 2 else 0
 
-    response = gmp.get_report(
-        report_id=report_id,
-        report_format_id=csv_report_format_id,
-        ignore_pagination=True,
-        details=True,
-    )
+    started = time.perf_counter()
+    if len(args.argv) > 3:
+        report_id = get_task_report_id(gmp, args.argv[3])
+    else:
+        report_id = get_latest_report_id(gmp)
 
-    report_element = response.find("report")
-    # get the full content of the report element
-    content = report_element.find("report_format").tail
+    # write to file and support ~ in filename path
+    csv_path = Path(csv_filename).expanduser()
+
+    written = write_csv_pages(gmp, report_id, csv_path, page_size)
 
-    if not content:
-        print(
+    if not written:
+        log(
             "Requested report is empty. Either the report does not contain any "
             " results or the necessary tools for creating the report are "
-            "not installed.",
-            file=sys.stderr,
+            "not installed."
         )
         sys.exit(1)
-
-    # convert content to 8-bit ASCII bytes
-    binary_base64_encoded_csv = content.encode("ascii")
-
-    # decode base64
-    binary_csv = b64decode(binary_base64_encoded_csv)
-
-    # write to file and support ~ in filename path
-    csv_path = Path(csv_filename).expanduser()
-
-    csv_path.write_bytes(binary_csv)
+    log(f"Exported report {report_id} in {time.perf_counter() - started:.3f}s")
 
     print("Done. CSV created: " + str(csv_path))
 
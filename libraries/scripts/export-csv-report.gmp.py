@@ -25,13 +25,80 @@
 # Added ignore_pagination=True, details=True to get the full report
 # 
 
+import os
 import sys
+import time
 
 from base64 import b64decode
 from pathlib import Path
 from argparse import Namespace
 from gvm.protocols.gmp import Gmp
 
+CORRELATION_ID = os.environ.get("GVM_CORRELATION_ID", "-")
+
+
+def log(message: str):
+    # Timings and errors go to stderr, the hooks log them with the request they belong to
+    print(f"[{CORRELATION_ID}] {message}", file=sys.stderr)
+
+
+def count_results(gmp: Gmp, report_id: str):
+    response = gmp.get_report(report_id=report_id, details=False)
+    count = response.findtext("report/report/result_count/filtered")
+    return int(count) if count else None
+
+
+def get_csv_pages(gmp: Gmp, report_id: str, page_size: int):
+    # without a page size the whole report is requested at once
+    total = count_results(gmp, report_id) if page_size > 0 else None
+    if total is None:
+        filters = [None]
+    else:
+        filters = [
+            f"first={first} rows={page_size}"
+            for first in range(1, max(total, 1) + 1, page_size)
+        ]
+
+    csv_report_format_id = "c1645568-627a-11e3-a660-406186ea4fc5"
+    header_written = False
+
+    for index, filter_string in enumerate(filters):
+        started = time.perf_counter()
+        response = gmp.get_report(
+            report_id=report_id,
+            report_format_id=csv_report_format_id,
+            filter_string=filter_string,
+            ignore_pagination=filter_string is None,
+            details=True,
+        )
+
+        report_element = response.find("report")
+        # get the full content of the report element
+        content = report_element.find("report_format").tail
+        if not content:
+            continue
+
+        # convert content to 8-bit ASCII bytes and decode base64
+        binary_csv = b64decode(content.encode("ascii"))
+
+        # every page starts with the header row
+        if header_written:
+            binary_csv = binary_csv.partition(b"\n")[2]
+        header_written = True
+        elapsed = time.perf_counter() - started
+        log(f"Fetched page {index + 1}/{len(filters)} in {elapsed:.3f}s")
+
+        yield binary_csv
+
+
+def write_csv_pages(gmp: Gmp, report_id: str, csv_path: Path, page_size: int):
+    written = False
+    with csv_path.open("wb") as csv_file:
+        for binary_csv in get_csv_pages(gmp, report_id, page_size):
+            csv_file.write(binary_csv)
+            written = True
+    return written
+
 
 def check_args(args):
     len_args = len(args.script) - 1
@@ -42,7 +109,8 @@ def check_args(args):
 
         1. <report_id>     -- ID of the report
         
-        Optional a file name to save the csv in.
+        Optional a file name to save the csv in, followed by a page size
+        to fetch the results in pages of that size.
 
         Examples:
             $ gvm-script --gmp-username name --gmp-password pass \
@@ -59,40 +127,27 @@ def main(gmp: Gmp, args: Namespace) -> None:
     check_args(args)
 
     report_id = args.argv[1]
-    if len(args.argv) == 3:
+    if len(args.argv) >= 3:
         csv_filename = args.argv[2] + ".csv"
     else:
         csv_filename = args.argv[1] + ".csv"
 
-    csv_report_format_id = "c1645568-627a-11e3-a660-406186ea4fc5"
+    page_size = int(args.argv[3]) if len(args.argv) > 3 else 0
 
-    response = gmp.get_report(
-        report_id=report_id, report_format_id=csv_report_format_id, ignore_pagination=True, details=True
-    )
+    # write to file and support ~ in filename path
+    csv_path = Path(csv_filename).expanduser()
 
-    report_element = response.find("report")
-    # get the full content of the report element
-    content = report_element.find("report_format").tail
+    started = time.perf_counter()
+    written = write_csv_pages(gmp, report_id, csv_path, page_size)
 
-    if not content:
-        print(
+    if not written:
+        log(
             'Requested report is empty. Either the report does not contain any '
             ' results or the necessary tools for creating the report are '
-            'not installed.',
-            file=sys.stderr,
+            'not installed.'
         )
         sys.exit(1)
-
-    # convert content to 8-bit ASCII bytes
-    binary_base64_encoded_csv = content.encode('ascii')
-
-    # decode base64
-    binary_csv = b64decode(binary_base64_encoded_csv)
-
-    # write to file and support ~ in filename path
-    csv_path = Path(csv_filename).expanduser()
-
-    csv_path.write_bytes(binary_csv)
+    log(f"Exported report {report_id} in {time.perf_counter() - started:.3f}s")
 
     print('Done. CSV created: ' + str(csv_path))
 
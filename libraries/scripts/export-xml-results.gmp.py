@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2021 Greenbone Networks GmbH
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Based on export-csv-report-latest.gmp.py
+#
+# Writes the raw GMP XML of a report, results included, to stdout without
+# rendering a report format so the caller can parse it incrementally.
+#
+# run script with e.g. gvm-script --gmp-username username --gmp-password password socket export-xml-results.gmp.py [report_id | ++task task] [++page-size 1000]
+#
+
+import os
+import sys
+import time
+
+from uuid import UUID
+
+from argparse import ArgumentParser, Namespace, RawTextHelpFormatter
+
+from lxml import etree
+
+from gvm.protocols.gmp import Gmp
+
+HELP_TEXT = (
+    "This script writes the results of a report as GMP XML to stdout. \n"
+    "Without a report id the latest finished report is exported, \n"
+    "or the latest finished report of the given task."
+)
+
+CORRELATION_ID = os.environ.get("GVM_CORRELATION_ID", "-")
+
+
+def log(message: str):
+    # Timings and errors go to stderr, the hooks log them with the request they belong to
+    print(f"[{CORRELATION_ID}] {message}", file=sys.stderr)
+
+
+def parse_args(args: Namespace) -> Namespace:  # pylint: disable=unused-argument
+    """Parsing args ..."""
+
+    parser = ArgumentParser(
+        prefix_chars="+",
+        add_help=False,
+        formatter_class=RawTextHelpFormatter,
+        description=HELP_TEXT,
+    )
+
+    parser.add_argument(
+        "+h",
+        "++help",
+        action="help",
+        help="Show this help message and exit.",
+    )
+
+    parser.add_argument(
+        "report_id",
+        type=str,
+        nargs="?",
+        help=("ID of the report, defaults to the latest finished report"),
+    )
+
+    parser.add_argument(
+        "++task",
+        type=str,
+        dest="task",
+        help=("ID or name of a task, exports its latest finished report"),
+    )
+
+    parser.add_argument(
+        "++page-size",
+        type=int,
+        default=0,
+        dest="page_size",
+        help=("Fetch the results in pages of this size, 0 fetches them at once"),
+    )
+    script_args, _ = parser.parse_known_args(args)
+    return script_args
+
+
+def get_latest_report_id(gmp: Gmp):
+    # Only the newest finished report is requested, without its results
+    response_xml = gmp.get_reports(
+        details=False,
+        filter_string="status=Done sort-reverse=modified first=1 rows=1",
+    )
+
+    reports_xml = response_xml.xpath("report")
+    if not reports_xml:
+        log("No finished report found.")
+        sys.exit(1)
+    return reports_xml[0].get("id")
+
+
+def task_filter(task: str):
+    # Alerts only know the task name, so a task is matched by ID or exact name
+    try:
+        if str(UUID(task)) == task.lower():
+            return f"uuid={task} rows=1"
+    except ValueError:
+        pass
+    return f'name="{task}" rows=1'
+
+
+def get_task_report_id(gmp: Gmp, task: str):
+    # gvmd keeps the last finished report of every task
+    response_xml = gmp.get_tasks(details=False, filter_string=task_filter(task))
+
+    tasks_xml = response_xml.xpath("task")
+    if not tasks_xml:
+        log(f"Task {task} not found.")
+        sys.exit(1)
+    report = tasks_xml[0].find("last_report/report")
+    if report is None:
+        log(f"Task {task} has no finished report.")
+        sys.exit(1)
+    return report.get("id")
+
+
+def count_results(gmp: Gmp, report_id: str):
+    response = gmp.get_report(report_id=report_id, details=False)
+    count = response.findtext("report/report/result_count/filtered")
+    return int(count) if count else None
+
+
+def write_result_pages(gmp: Gmp, report_id: str, page_size: int):
+    # Pages are written as one <report> holding the task, timestamp and all results
+    total = count_results(gmp, report_id)
+    filters = [
+        f"first={first} rows={page_size}"
+        for first in range(1, max(total or 0, 1) + 1, page_size)
+    ]
+
+    output = sys.stdout.buffer
+    for index, filter_string in enumerate(filters):
+        started = time.perf_counter()
+        response = gmp.get_report(
+            report_id=report_id,
+            filter_string=filter_string,
+            ignore_pagination=False,
+            details=True,
+        )
+
+        report_element = response.find("report/report")
+        if report_element is None:
+            log(f"Report {report_id} not found.")
+            sys.exit(1)
+
+        if index == 0:
+            output.write(f'<report id="{report_id}">'.encode())
+            for name in ["task", "timestamp"]:
+                element = report_element.find(name)
+                if element is not None:
+                    output.write(etree.tostring(element))
+            output.write(b"<results>")
+
+        for result in report_element.iterfind("results/result"):
+            output.write(etree.tostring(result))
+        output.flush()
+        elapsed = time.perf_counter() - started
+        log(f"Fetched page {index + 1}/{len(filters)} in {elapsed:.3f}s")
+
+    output.write(b"</results></report>")
+    output.flush()
+
+
+def main(gmp: Gmp, args: Namespace) -> None:
+    # pylint: disable=undefined-variable
+    if args.script:
+        args = args.script[1:]
+
+    parsed_args = parse_args(args=args)
+
+    if parsed_args.report_id:
+        report_id = parsed_args.report_id
+    elif parsed_args.task:
+        report_id = get_task_report_id(gmp, parsed_args.task)
+    else:
+        report_id = get_latest_report_id(gmp)
+
+    if parsed_args.page_size > 0:
+        started = time.perf_counter()
+        write_result_pages(gmp, report_id, parsed_args.page_size)
+        elapsed = time.perf_counter() - started
+        log(f"Exported results of report {report_id} in {elapsed:.3f}s")
+        return
+
+    response = gmp.get_report(
+        report_id=report_id,
+        ignore_pagination=True,
+        details=True,
+    )
+
+    report_element = response.find("report")
+    if report_element is None:
+        log(f"Report {report_id} not found.")
+        sys.exit(1)
+
+    sys.stdout.buffer.write(etree.tostring(report_element))
+    sys.stdout.buffer.flush()
+
+
+if __name__ == "__gmp__":
+    main(gmp, args)
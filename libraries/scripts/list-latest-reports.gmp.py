@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2021 Greenbone Networks GmbH
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Based on list-reports.gmp.py
+#
+# Lists the latest finished (Done) report of every task with a single
+# get_tasks request, using the last_report gvmd keeps for each task.
+#
+# run script with e.g. gvm-script --gmp-username username --gmp-password password socket list-latest-reports.gmp.py
+#
+
+from gvm.protocols.gmp import Gmp
+
+from gvmtools.helper import Table
+
+from argparse import Namespace
+
+
+def get_latest_report_ids_per_task(gmp: Gmp):
+    response_xml = gmp.get_tasks(
+        ignore_pagination=True, details=False, filter_string="rows=-1"
+    )
+
+    latest_reports = []
+    for task in response_xml.xpath("task"):
+        report = task.find("last_report/report")
+        if report is None:
+            continue
+        latest_reports.append(
+            [
+                task.get("id"),
+                "".join(task.xpath("name/text()")),
+                report.get("id"),
+                "".join(report.xpath("timestamp/text()")),
+            ]
+        )
+    return latest_reports
+
+
+def main(gmp: Gmp, args: Namespace) -> None:
+    # pylint: disable=unused-argument
+
+    print("Listing latest finished report per task.\n")
+
+    heading = ["#", "Task Id", "Task Name", "Report Id", "Timestamp"]
+    rows = [
+        [str(number), *latest_report]
+        for number, latest_report in enumerate(
+            get_latest_report_ids_per_task(gmp), start=1
+        )
+    ]
+
+    print(Table(heading=heading, rows=rows))
+
+
+if __name__ == "__gmp__":
+    main(gmp, args)
@@ -0,0 +1,73 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+
+class GVMJobCancelled(Exception):
+    pass
+
+
+class GVMShipStats:
+    STAGES = ["ingest", "process", "output"]
+
+    def __init__(self, cancelled: threading.Event | None = None):
+        self.cancelled = cancelled
+        self.report_id: str | None = None
+        self.rows_in = 0
+        self.rows_out = 0
+        self.rows_skipped = 0
+        self.bytes_written = 0
+        self.stages = {stage: 0.0 for stage in self.STAGES}
+
+        self.__stack: list[str] = []
+        self.__mark = 0.0
+
+    def __switch(self):
+        now = time.perf_counter()
+        if self.__stack:
+            self.stages[self.__stack[-1]] += now - self.__mark
+        self.__mark = now
+
+    @contextmanager
+    def stage(self, name: str):
+        # Time is only charged to the innermost stage, so nested stages never count twice
+        # Cancels are checked here too, a job that does not stream has no chunks
+        self.check()
+        self.__switch()
+        self.__stack.append(name)
+        try:
+            yield
+        finally:
+            self.__switch()
+            self.__stack.pop()
+
+    def timed(self, items: Iterable, name: str) -> Iterator:
+        # Meant for chunks and pages, every item pays for two clock reads
+        iterator = iter(items)
+        while True:
+            self.check()
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def check(self):
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise GVMJobCancelled("Job was cancelled")
+
+    def to_dict(self) -> dict:
+        # Also called for running jobs, the stage in progress counts up to now
+        stages = dict(self.stages)
+        for name in self.__stack[-1:]:
+            stages[name] += time.perf_counter() - self.__mark
+        return {
+            "report_id": self.report_id,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_skipped": self.rows_skipped,
+            "bytes_written": self.bytes_written,
+            "stages": {stage: round(value, 3) for stage, value in stages.items()},
+        }
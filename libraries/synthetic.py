@@ -0,0 +1,191 @@
+import csv
+import random
+import re
+import uuid
+from pathlib import Path
+from typing import Iterator
+from lxml import etree
+from libraries.gmp_results import CSV_COLUMNS
+
+WORDS = (
+    "remote host service version detected vulnerable update installed package "
+    "attacker could allow execution arbitrary code denial information disclosure "
+    "authentication bypass certificate protocol request response server client "
+    "configuration default credentials upgrade vendor advisory affected release"
+).split()
+
+SEVERITIES = [(7.0, "High"), (4.0, "Medium"), (0.1, "Low"), (0.0, "Log")]
+SOLUTION_TYPES = ["VendorFix", "Mitigation", "Workaround", "WillNotFix", ""]
+PORTS = [("22", "tcp"), ("80", "tcp"), ("443", "tcp"), ("5432", "tcp"), ("161", "udp")]
+DETECTION_PATTERN = re.compile(r"(?s)(.*)\nDetails:\n.*\nVersion used: (.*)\n$")
+
+
+class GVMReportGenerator:
+    def __init__(
+        self,
+        rows: int,
+        seed: int = 0,
+        max_references: int = 5,
+        text_size: int = 400,
+        hosts: int = 254,
+        nvts: int = 2000,
+        task_id: str | None = None,
+        task_name: str = "Synthetic scan",
+        timestamp: str = "2024-08-13T06:55:09Z",
+    ):
+        self.rows = rows
+        self.seed = seed
+        self.max_references = max_references
+        self.text_size = text_size
+        self.hosts = hosts
+        self.task_name = task_name
+        self.timestamp = timestamp
+
+        rng = random.Random(seed)
+        self.task_id = task_id or str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        # Results of the same NVT share their descriptions, like in a real report
+        self.__nvts = [self.__nvt(rng, index) for index in range(nvts)]
+
+    def __text(self, rng: random.Random, size: int) -> str:
+        words = []
+        length = 0
+        while length < size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        # Reports wrap their text fields, so the processing has to handle newlines
+        lines = [
+            " ".join(words[index : index + 10]) for index in range(0, len(words), 10)
+        ]
+        return "\n".join(lines)
+
+    def __references(self, rng: random.Random, make, empty_ratio: float = 0.4) -> str:
+        if self.max_references <= 0 or rng.random() < empty_ratio:
+            return ""
+        return ",".join(make() for _ in range(rng.randint(1, self.max_references)))
+
+    def __nvt(self, rng: random.Random, index: int) -> dict:
+        cvss = round(rng.choice([0.0, 0.0, rng.uniform(0.1, 10.0)]), 1)
+        severity = next(name for bound, name in SEVERITIES if cvss >= bound)
+        text = self.text_size
+        name = f"{' '.join(rng.choices(WORDS, k=4)).title()} ({index})"
+        oid = f"1.3.6.1.4.1.25623.1.0.{100000 + index}"
+        return {
+            "CVSS": f"{cvss:.1f}",
+            "Severity": severity,
+            "QoD": str(rng.choice([30, 70, 75, 80, 95, 97, 98])),
+            "Solution Type": rng.choice(SOLUTION_TYPES) if cvss else "",
+            "NVT Name": name,
+            "Summary": self.__text(rng, text // 2),
+            "NVT OID": oid,
+            "CVEs": self.__references(
+                rng, lambda: f"CVE-{rng.randint(1999, 2024)}-{rng.randint(1000, 49999)}"
+            ),
+            "Impact": self.__text(rng, text // 4) if cvss else "",
+            "Solution": self.__text(rng, text // 4) if cvss else "",
+            "Affected Software/OS": self.__text(rng, text // 8) if cvss else "",
+            "Vulnerability Insight": self.__text(rng, text // 4) if cvss else "",
+            # Same layout as gvmd, which appends the NVT to the detection method
+            "Vulnerability Detection Method": (
+                f"{self.__text(rng, text // 4)}\nDetails:\n{name}\n(OID: {oid})\n"
+                f"Version used: 2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T10:11:28Z\n"
+            ),
+            "BIDs": self.__references(
+                rng, lambda: str(rng.randint(10000, 99999)), empty_ratio=0.8
+            ),
+            "CERTs": self.__references(
+                rng,
+                lambda: rng.choice(["DFN-CERT", "CB-K"])
+                + f"-{rng.randint(2015, 2024)}-{rng.randint(1, 2999):04d}",
+            ),
+            "Other References": self.__references(
+                rng, lambda: f"https://example.com/advisory/{rng.randint(1, 99999)}"
+            ),
+        }
+
+    def record(self, index: int) -> dict:
+        # Every row has its own seed, so any page of a report can be rendered on its own
+        rng = random.Random(f"{self.seed}:{index}")
+        host = index % self.hosts
+        port, protocol = rng.choice(PORTS) if rng.random() < 0.7 else ("", "")
+        ip = f"10.{host >> 16 & 255}.{host >> 8 & 255}.{host & 255}"
+        return {
+            # The CSV report format pads the first IP of a report
+            "IP": f"      {ip}" if index == 0 else ip,
+            "Hostname": f"host-{host}.example.com" if rng.random() < 0.8 else "",
+            "Port": port,
+            "Port Protocol": protocol,
+            **rng.choice(self.__nvts),
+            "Specific Result": self.__text(rng, self.text_size // 4),
+            "Task ID": self.task_id,
+            "Task Name": self.task_name,
+            "Timestamp": self.timestamp,
+            "Result ID": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "Product Detection Result": "",
+        }
+
+    def iter_records(self, first: int = 0, count: int | None = None) -> Iterator[dict]:
+        last = self.rows if count is None else min(first + count, self.rows)
+        for index in range(first, last):
+            yield self.record(index)
+
+    def iter_rows(self, first: int = 0, count: int | None = None) -> Iterator[list]:
+        for record in self.iter_records(first, count):
+            yield [record[column] for column in CSV_COLUMNS]
+
+    def write_csv(self, path: Path | str) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(CSV_COLUMNS)
+            writer.writerows(self.iter_rows())
+        return path
+
+
+def record_to_result(record: dict) -> etree._Element:
+    # The GMP <result> that libraries.gmp_results maps back onto the same CSV row
+    E = etree.SubElement
+    result = etree.Element("result", id=record["Result ID"])
+    host = E(result, "host")
+    host.text = record["IP"].strip()
+    if record["Hostname"]:
+        E(host, "hostname").text = record["Hostname"]
+    E(result, "port").text = (
+        f"{record['Port']}/{record['Port Protocol']}"
+        if record["Port"]
+        else "general/tcp"
+    )
+
+    nvt = E(result, "nvt", oid=record["NVT OID"])
+    E(nvt, "name").text = record["NVT Name"]
+    detection = DETECTION_PATTERN.match(record["Vulnerability Detection Method"])
+    tags = {
+        "summary": record["Summary"],
+        "insight": record["Vulnerability Insight"],
+        "affected": record["Affected Software/OS"],
+        "impact": record["Impact"],
+        "vuldetect": detection.group(1) if detection else None,
+    }
+    E(nvt, "tags").text = "|".join(
+        f"{name}={value}" for name, value in tags.items() if value
+    )
+    solution = E(nvt, "solution")
+    solution.text = record["Solution"] or None
+    if record["Solution Type"]:
+        solution.set("type", record["Solution Type"])
+    refs = E(nvt, "refs")
+    for column, kind in [("CVEs", "cve"), ("BIDs", "bid"), ("Other References", "url")]:
+        for reference in filter(None, record[column].split(",")):
+            E(refs, "ref", type=kind, id=reference)
+    for reference in filter(None, record["CERTs"].split(",")):
+        kind = "dfn-cert" if reference.startswith("DFN-CERT") else "cert-bund"
+        E(refs, "ref", type=kind, id=reference)
+
+    E(result, "scan_nvt_version").text = detection.group(2) if detection else ""
+    E(result, "threat").text = record["Severity"]
+    E(result, "severity").text = record["CVSS"]
+    E(E(result, "qod"), "value").text = record["QoD"]
+    E(result, "description").text = record["Specific Result"] or None
+    E(result, "creation_time").text = record["Timestamp"]
+    return result
@@ -0,0 +1,97 @@
+import json
+import os
+import time
+from datetime import datetime
+from typing import BinaryIO, Iterable
+from config import Config
+
+
+class GVMSyslogWriter:
+    def __init__(
+        self,
+        host_name: str = "root",
+        program_name: str = "openvas",
+        buffer_size: int | None = None,
+    ):
+        self.host_name = host_name
+        self.program_name = program_name
+        self.buffer_size = (
+            buffer_size if buffer_size is not None else Config.OUTPUT_BUFFER_SIZE
+        )
+        self.sinks: list[BinaryIO] = []
+        self.__renames: list[tuple[str, str]] = []
+        self.lines_written = 0
+        self.bytes_written = 0
+
+        self.__pending: list[str] = []
+        self.__pending_size = 0
+        self.__prefix_second = None
+        self.__prefix = ""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(discard=exc_type is not None)
+
+    def add_sink(self, output_file: str, mode: str = "w"):
+        if mode != "w":
+            self.sinks.append(open(output_file, f"{mode}b"))
+            return
+
+        # Overwritten files are replaced on close, readers never see a partial file
+        temp_file = f"{output_file}.{os.getpid()}.tmp"
+        self.sinks.append(open(temp_file, "wb"))
+        self.__renames.append((temp_file, output_file))
+
+    def prefix(self) -> str:
+        # The syslog timestamp only has second resolution, so it is rebuilt once per second
+        now = int(time.time())
+        if now != self.__prefix_second:
+            current_time = datetime.fromtimestamp(now).strftime("%b %d %H:%M:%S")
+            self.__prefix = f"{current_time} {self.host_name} {self.program_name}: "
+            self.__prefix_second = now
+        return self.__prefix
+
+    def write(self, entry: dict):
+        line = f"{self.prefix()}{json.dumps(entry)}\n"
+        self.__pending.append(line)
+        self.__pending_size += len(line)
+        self.lines_written += 1
+
+        if self.__pending_size >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, entries: Iterable[dict]):
+        for entry in entries:
+            self.write(entry)
+
+    def flush(self):
+        if not self.__pending:
+            return
+
+        data = "".join(self.__pending).encode()
+        for sink in self.sinks:
+            sink.write(data)
+        self.bytes_written += len(data)
+
+        self.__pending = []
+        self.__pending_size = 0
+
+    def close(self, discard: bool = False):
+        try:
+            if not discard:
+                self.flush()
+        except BaseException:
+            discard = True
+            raise
+        finally:
+            for sink in self.sinks:
+                sink.close()
+            for temp_file, output_file in self.__renames:
+                if discard:
+                    os.remove(temp_file)
+                else:
+                    os.replace(temp_file, output_file)
+            self.sinks = []
+            self.__renames = []
@@ -0,0 +1,60 @@
+import importlib.machinery
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# config.py is local to every installation, the tests run against the example settings
+loader = importlib.machinery.SourceFileLoader("config", str(ROOT / "config.py.example"))
+config = importlib.util.module_from_spec(
+    importlib.util.spec_from_loader("config", loader)
+)
+loader.exec_module(config)
+sys.modules["config"] = config
+
+from config import Config
+from libraries import GVMLogger
+from classes.gvm_fake_gvmd import GVMFakeGvmd
+from classes.gvm_hooks import GVMHooks
+
+
+@pytest.fixture
+def logger(tmp_path: Path) -> GVMLogger:
+    return GVMLogger.get(f"tests.{tmp_path.name}", tmp_path / "tests.log")
+
+
+@pytest.fixture
+def gvmd(tmp_path: Path, logger: GVMLogger) -> GVMFakeGvmd:
+    server = GVMFakeGvmd(
+        tmp_path / "gvmd.sock",
+        logger,
+        tasks=1,
+        results=200,
+        result_latency=0.001,
+        username="admin",
+        password="admin",
+    ).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def hooks(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, gvmd: GVMFakeGvmd
+) -> GVMHooks:
+    monkeypatch.setattr(Config, "JOB_STORE_FILE", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(Config, "CACHE_PATH", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "ALLOWED_IP_FILE", str(tmp_path / "allowed_ips"))
+    monkeypatch.setattr(Config, "HOOKS_ENGINE", "threads")
+    monkeypatch.setattr(Config, "HOOKS_DEBOUNCE", 60)
+    monkeypatch.setattr(Config, "GMP_POOL_SIZE", 2)
+    monkeypatch.setattr(Config, "GMP_SOCKET_PATH", str(gvmd.socket_path))
+    monkeypatch.setattr(Config, "USERNAME", "admin")
+    monkeypatch.setattr(Config, "PASSWORD", "admin")
+    hooks = GVMHooks()
+    yield hooks
+    hooks.gmp_pool.close()
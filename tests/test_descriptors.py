@@ -0,0 +1,26 @@
+import os
+
+from classes.gvm_report import GVMReport
+
+CALLS = 2000
+
+
+def open_descriptors() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+def test_descriptors_stay_flat_over_hook_calls(hooks):
+    client = hooks.app.test_client()
+
+    def hook_call():
+        # A request to the hooks and the report a shipping job builds for it
+        assert client.get("/api/report/latest").status_code == 200
+        GVMReport(pool=hooks.gmp_pool)
+
+    # The first call opens what stays open for the life of the process, like log files
+    hook_call()
+    before = open_descriptors()
+    for _ in range(CALLS):
+        hook_call()
+
+    assert open_descriptors() <= before
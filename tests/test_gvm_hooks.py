@@ -0,0 +1,23 @@
+def job_id(response) -> str:
+    return response.get_data(as_text=True).split()[-1]
+
+
+def test_latest_and_task_triggers_coalesce_on_their_report(hooks):
+    client = hooks.app.test_client()
+
+    first = client.get("/api/report/latest")
+    assert "queued as" in first.get_data(as_text=True)
+    job = hooks.jobs.get(job_id(first))
+    assert job.key.startswith("report:")
+
+    # The alert of the task that produced the same report
+    second = client.get("/api/task/Synthetic task 1/report")
+    assert "attached to" in second.get_data(as_text=True)
+    assert job_id(second) == job.id
+
+    claimed = hooks.jobs.claim("test:1")
+    hooks.jobs.complete(claimed, {"report_id": job.params["report_id"]})
+
+    third = client.get("/api/report/latest")
+    assert "debounced by" in third.get_data(as_text=True)
+    assert job_id(third) == job.id
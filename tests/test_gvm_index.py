@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from collections import Counter
+
+import pytest
+from config import Config
+from classes.gvm_async_report import GVMAsyncReport
+from classes.gvm_fake_gvmd import GVMFakeGvmd
+from classes.gvm_index import GVMShipIndex
+from classes.gvm_pool import GVMAsyncConnectionPool, GVMConnectionPool
+from classes.gvm_report import GVMReport
+
+
+@pytest.fixture
+def index_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "SHIP_INDEX_ENABLED", True)
+    monkeypatch.setattr(Config, "SHIP_INDEX_FILE", str(tmp_path / "ship_index.db"))
+    monkeypatch.setattr(Config, "OUTPUT_PATH", str(tmp_path / "scans"))
+    monkeypatch.setattr(Config, "REPORT_LOG_FILE", str(tmp_path / "report.log"))
+    return tmp_path / "ship_index.db"
+
+
+def pool_options(gvmd: GVMFakeGvmd) -> dict:
+    return {
+        "socket_path": str(gvmd.socket_path),
+        "username": "admin",
+        "password": "admin",
+        "size": 2,
+        "timeout": 30,
+    }
+
+
+def read_lines(path) -> Counter:
+    with open(path, "rb") as file:
+        return Counter(file.readlines())
+
+
+def assert_shipped_once(tmp_path):
+    # Reports may hold the same line more than once, the second job must add nothing
+    staged = sorted(
+        (read_lines(tmp_path / name) for name in ("latest", "report")), key=len
+    )
+    assert not staged[0]
+    assert staged[1]
+    assert read_lines(Config.OUTPUT_PATH) == staged[1]
+
+
+def test_second_job_waits_and_skips_what_the_first_shipped(index_file, logger):
+    entries = [{"Result ID": str(i), "CVEs": "CVE-2024-0001"} for i in range(10)]
+    first, second = GVMShipIndex(index_file, logger), GVMShipIndex(index_file, logger)
+    emitted = []
+
+    def run_second():
+        with second.transaction("report-1"):
+            emitted.extend(second.filter(entries))
+
+    with first.transaction("report-1"):
+        emitted.extend(first.filter(entries))
+        thread = threading.Thread(target=run_second)
+        thread.start()
+        thread.join(0.5)
+        # Blocked until the first job has merged its keys
+        assert thread.is_alive()
+    thread.join(10)
+
+    assert len(emitted) == len(entries)
+    assert second.skipped == len(entries)
+
+
+def test_reset_ships_everything_again(index_file, logger):
+    entries = [{"Result ID": str(i), "CVEs": "CVE-2024-0001"} for i in range(10)]
+    index = GVMShipIndex(index_file, logger)
+    with index.transaction("report-1"):
+        list(index.filter(entries))
+    with index.transaction("report-1"):
+        assert not list(index.filter(entries))
+
+    index.reset()
+    with index.transaction("report-1"):
+        assert list(index.filter(entries)) == entries
+
+
+def test_concurrent_jobs_of_a_report_ship_each_line_once(index_file, logger, gvmd):
+    pool = GVMConnectionPool(logger, **pool_options(gvmd))
+    report_id = GVMReport(pool=pool).get_latest_report_id()
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def ship(name: str, params: dict):
+        try:
+            barrier.wait()
+            GVMReport(pool=pool).ship_data(str(index_file.parent / name), **params)
+        except Exception as e:
+            errors.append(e)
+
+    # A latest trigger and a report trigger that resolve to the same report
+    threads = [
+        threading.Thread(target=ship, args=("latest", {})),
+        threading.Thread(target=ship, args=("report", {"report_id": report_id})),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    pool.close()
+
+    assert not errors
+    assert_shipped_once(index_file.parent)
+
+
+def test_concurrent_async_jobs_of_a_report_ship_each_line_once(
+    index_file, logger, gvmd
+):
+    async def main():
+        pool = GVMAsyncConnectionPool(logger, **pool_options(gvmd))
+        report_id = await GVMAsyncReport(pool=pool).get_latest_report_id_async()
+        await asyncio.gather(
+            GVMAsyncReport(pool=pool).ship_data_async(
+                str(index_file.parent / "latest")
+            ),
+            GVMAsyncReport(pool=pool).ship_data_async(
+                str(index_file.parent / "report"), report_id=report_id
+            ),
+        )
+        pool.close()
+
+    asyncio.run(main())
+    assert_shipped_once(index_file.parent)
@@ -0,0 +1,54 @@
+import pytest
+from classes.gvm_jobs import GVMJobStore
+
+
+@pytest.fixture
+def store(tmp_path, logger) -> GVMJobStore:
+    return GVMJobStore(tmp_path / "jobs.db", logger, debounce=60)
+
+
+def ship(store: GVMJobStore, report_id: str):
+    job = store.claim("test:1")
+    store.complete(job, {"report_id": report_id})
+    return job
+
+
+def test_latest_trigger_is_not_debounced_by_a_finished_job(store):
+    job, relation = store.enqueue({})
+    assert relation == "queued as"
+    ship(store, "old-report")
+
+    # A newer scan finished right after, its trigger must not be swallowed
+    newer, relation = store.enqueue({})
+    assert relation == "queued as"
+    assert newer.id != job.id
+
+
+def test_task_trigger_does_not_attach_to_a_running_job(store):
+    job, _ = store.enqueue({"task": "Scan"})
+    store.claim("test:1")
+
+    newer, relation = store.enqueue({"task": "Scan"})
+    assert relation == "queued as"
+    assert newer.id != job.id
+
+
+def test_latest_trigger_attaches_to_a_queued_job(store):
+    job, _ = store.enqueue({})
+    attached, relation = store.enqueue({})
+    assert relation == "attached to"
+    assert attached.id == job.id
+    assert store.get(job.id).triggers == 2
+
+
+def test_report_trigger_is_attached_and_debounced(store):
+    params = {"report_id": "0d6a1b6e-4a5f-4b7e-9d55-2f3c1a7b8e90"}
+    job, _ = store.enqueue(params)
+    store.claim("test:1")
+    assert store.enqueue(params)[1] == "attached to"
+
+    store.complete(store.get(job.id))
+    debounced, relation = store.enqueue(params)
+    assert relation == "debounced by"
+    assert debounced.id == job.id
+    assert store.enqueue({**params, "force": True})[1] == "queued as"
@@ -0,0 +1,37 @@
+import csv
+import io
+
+import pytest
+from classes.gvm_report import GVMReport
+from libraries.gmp_results import CSV_COLUMNS
+
+
+def make_csv(rows: list[dict]) -> str:
+    output = io.StringIO()
+    writer = csv.DictWriter(output, CSV_COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("engine", GVMReport.ENGINES)
+def test_chunked_output_matches_whole_file(engine):
+    # The first chunk only holds numeric looking text, the second does not
+    data = make_csv(
+        [
+            {"Port": 80, "CVSS": 5.0, "QoD": 70, "Specific Result": "80"},
+            {"Port": "", "CVSS": 7.5, "QoD": 80, "Specific Result": "443"},
+            {"Port": 22, "CVSS": 0.0, "QoD": 99, "Specific Result": "OpenSSH 9.6"},
+        ]
+    )
+    report = GVMReport(engine=engine)
+
+    whole = report.process_data(io.StringIO(data))
+    chunked = list(report.process_data(io.StringIO(data), chunk_size=2))
+
+    assert chunked == whole
+    # Every row fans out into one record per CERT, CVE and BID, blank ones included
+    rows = whole[::3]
+    assert [row["Specific Result"] for row in rows] == ["80", "443", "OpenSSH 9.6"]
+    assert [row["Port"] for row in rows] == [80, None, 22]
+    assert [row["CVSS"] for row in rows] == [5, 7.5, 0]
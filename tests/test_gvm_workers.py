@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+from libraries import GVMJobCancelled, GVMShipStats
+from classes.gvm_jobs import GVMJobStore, GVMShipJob
+from classes.gvm_workers import GVMWorkerPool
+
+
+@pytest.fixture
+def workers(tmp_path, logger):
+    store = GVMJobStore(tmp_path / "jobs.db", logger)
+    pool = GVMWorkerPool(
+        logger, store, workers=1, process_workers=0, poll_interval=0.05
+    )
+    pool.STATS_INTERVAL = 0.1
+    yield pool
+    pool.shutdown(timeout=10)
+
+
+def wait_for(condition, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_stats_of_running_jobs_are_saved(workers):
+    finish = threading.Event()
+
+    def handler(job: GVMShipJob, stats: GVMShipStats):
+        with stats.stage("ingest"):
+            stats.rows_in = 42
+            finish.wait(10)
+
+    job, _ = workers.store.enqueue({"report_id": "report-1"})
+    workers.start(handler)
+    try:
+        assert wait_for(lambda: (workers.store.get(job.id).stats or {}).get("rows_in"))
+        running = workers.store.get(job.id)
+        assert running.state == GVMShipJob.RUNNING
+        assert running.stats["rows_in"] == 42
+        assert running.stats["stages"]["ingest"] > 0
+    finally:
+        finish.set()
+
+
+def test_cancel_stops_a_job_between_stages(workers):
+    running = []
+
+    def handler(job: GVMShipJob, stats: GVMShipStats):
+        # One stage with no chunks, like a report read without streaming
+        with stats.stage("ingest"):
+            running.append(stats)
+            stats.cancelled.wait(10)
+        with stats.stage("process"):
+            pass
+
+    job, _ = workers.store.enqueue({"report_id": "report-1"})
+    workers.start(handler)
+    assert wait_for(lambda: running)
+    # The API only flags the job in the store, the heartbeat passes it on
+    workers.store.request_cancel(job.id)
+
+    assert wait_for(lambda: workers.store.get(job.id).state == GVMShipJob.CANCELLED)
+
+
+def test_entering_a_stage_checks_for_cancel():
+    cancelled = threading.Event()
+    stats = GVMShipStats(cancelled)
+    cancelled.set()
+    with pytest.raises(GVMJobCancelled):
+        with stats.stage("process"):
+            pass
+
+
+def test_aborted_drain_hands_running_jobs_back(workers, monkeypatch):
+    running = threading.Event()
+    finish = threading.Event()
+
+    def handler(job: GVMShipJob, stats: GVMShipStats):
+        running.set()
+        finish.wait(10)
+
+    job, _ = workers.store.enqueue({"report_id": "report-1"})
+    workers.start(handler)
+    assert running.wait(10)
+
+    class Aborted:
+        # What gunicorn's SIGABRT handler raises in the middle of worker_exit
+        def join(self, timeout=None):
+            raise SystemExit(1)
+
+    monkeypatch.setattr(workers, "_GVMWorkerPool__threads", [Aborted()])
+    with pytest.raises(SystemExit):
+        workers.shutdown(timeout=30)
+    assert workers.store.get(job.id).state == GVMShipJob.QUEUED
+    finish.set()